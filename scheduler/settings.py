@@ -184,3 +184,32 @@ os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = GOOGLE_APPLICATION_CREDENTIALS
 # Google Gemini API settings
 # Get your API key from https://aistudio.google.com/app/apikey
 GEMINI_API_KEY = "--------------------------------"  # Add your Gemini API key here
+
+# Create the Gemini client in a background thread at startup, so the first
+# chat message doesn't wait for it
+CHATBOT_WARMUP = True
+
+# Seconds the local Google Calendar mirror is trusted for scheduling before
+# an incremental sync is run
+CALENDAR_SYNC_INTERVAL = 300
+
+# Calendar months are cached in the default cache, keyed by the user's
+# schedule version, so a per-process cache stays correct with several
+# processes. A shared backend (Redis or Memcached) lets them share entries.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Chatbot answers to general questions, least recently used evicted first
+    'chatbot': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'chatbot',
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+}
+
+# Seconds a cached calendar month is kept
+CALENDAR_CACHE_TIMEOUT = 60 * 60 * 24
@@ -1,6 +1,23 @@
+import threading
+
 from django.apps import AppConfig
+from django.conf import settings
+
+
+def _warm_up_chatbot():
+    # Importing the Gemini SDK takes a while, so it happens here too
+    from .chatbot import warm_up_chatbot
+    warm_up_chatbot()
 
 
 class TasksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tasks'
+
+    def ready(self):
+        # Register signal handlers
+        from . import signals  # noqa: F401
+        
+        # Set up the Gemini client in the background before the first chat message arrives
+        if getattr(settings, 'CHATBOT_WARMUP', True):
+            threading.Thread(target=_warm_up_chatbot, name='chatbot-warmup', daemon=True).start()
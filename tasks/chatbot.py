@@ -66,24 +66,57 @@
 import google.generativeai as genai
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
-from django.core.cache import cache
+from django.core.cache import cache, caches, InvalidCacheBackendError
 from .models import Task, Habit
+from . import digest, intents
+from .singleflight import SingleFlight
 from django.conf import settings
-from datetime import datetime, timedelta
+from django.utils import timezone
+from datetime import datetime, time
 import logging
 import json
+import re
+import hashlib
+import threading
 
 logger = logging.getLogger(__name__)
 
+# Process-wide handler, created on first use or by warm_up_chatbot()
+_handler = None
+_handler_lock = threading.Lock()
+
+# Seconds a model answer is reused for the same normalized prompt
+RESPONSE_CACHE_TIMEOUT = getattr(settings, 'CHATBOT_RESPONSE_CACHE_TIMEOUT', 60 * 60)
+
+# Identical prompts asked at the same time share one model call
+_model_calls = SingleFlight()
+
+
+def _response_cache():
+    # A dedicated, size-bounded 'chatbot' cache if configured
+    try:
+        return caches['chatbot']
+    except InvalidCacheBackendError:
+        return cache
+
+
+def normalize_prompt(prompt):
+    """Fold case, whitespace and trailing punctuation so near-identical prompts share a cache entry."""
+    return re.sub(r'\s+', ' ', prompt).strip().lower().rstrip('?!. ')
+
 class ChatbotHandler:
-    def __init__(self):
-        self.gemini_api_key = getattr(settings, 'GEMINI_API_KEY', None)
-        if not self.gemini_api_key:
-            logger.error("Gemini API key not configured")
-            raise ValueError("Gemini API key not configured in settings")
-        
-        genai.configure(api_key=self.gemini_api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
+    def __init__(self, model=None):
+        # A model can be passed in, e.g. tasks.fakes.FakeGenerativeModel for tests
+        if model is not None:
+            self.model = model
+        else:
+            self.gemini_api_key = getattr(settings, 'GEMINI_API_KEY', None)
+            if not self.gemini_api_key:
+                logger.error("Gemini API key not configured")
+                raise ValueError("Gemini API key not configured in settings")
+            
+            genai.configure(api_key=self.gemini_api_key)
+            self.model = genai.GenerativeModel('gemini-1.5-flash')
         
         self.system_prompt = """You are an AI assistant for a task management system. Help users:
         - Create tasks (title, description, duration, deadline, priority)
@@ -129,19 +162,13 @@ class ChatbotHandler:
             logger.error(f"Cache delete error: {e}")
 
     def _parse_datetime(self, datetime_str):
-        try:
-            return datetime.strptime(datetime_str, "%B %d %Y %H:%M")
-        except ValueError:
+        """Parse a date or date and time in the current timezone. Returns None if no format fits."""
+        for datetime_format in ("%B %d %Y %H:%M", "%B %d %Y", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
             try:
-                return datetime.strptime(datetime_str, "%B %d %Y")
+                return timezone.make_aware(datetime.strptime(datetime_str, datetime_format))
             except ValueError:
-                try:
-                    return datetime.strptime(datetime_str, "%Y-%m-%d %H:%M")
-                except ValueError:
-                    try:
-                        return datetime.strptime(datetime_str, "%Y-%m-%d")
-                    except ValueError:
-                        return None
+                continue
+        return None
 
     def _parse_time(self, time_str):
         try:
@@ -152,7 +179,9 @@ class ChatbotHandler:
     def _create_task(self, data, user):
         try:
             # Convert and validate fields
-            deadline = self._parse_datetime(data['deadline'])
+            deadline = data['deadline']
+            if not isinstance(deadline, datetime):
+                deadline = self._parse_datetime(deadline)
             if not deadline:
                 raise ValueError("Invalid deadline format")
             
@@ -165,8 +194,9 @@ class ChatbotHandler:
             if priority not in [1, 2, 3]:
                 priority = 2
             
-            # First schedule the task time
-            scheduled_time = deadline - timedelta(minutes=duration)
+            # Schedule the task with the same engine as the task form
+            from .utils import schedule_task
+            scheduled_time = schedule_task(user, duration, deadline, priority)
             
             task = Task.objects.create(
                 user=user,
@@ -178,21 +208,9 @@ class ChatbotHandler:
                 scheduled_time=scheduled_time
             )
             
-            # Add to Google Calendar if user has connected their account
-            if hasattr(user, 'socialaccount_set') and user.socialaccount_set.filter(provider='google').exists():
-                try:
-                    from .utils import get_calendar_service, schedule_task_in_calendar
-                    service = get_calendar_service(user)
-                    # First save the task to get an ID
-                    task.save()
-                    # Then schedule in calendar and update the task
-                    event_id = schedule_task_in_calendar(service, task)
-                    task.google_event_id = event_id
-                    task.save()
-                except Exception as e:
-                    logger.error(f"Could not add task to Google Calendar: {str(e)}")
-                    # Save the task even if calendar integration fails
-                    task.save()
+            # Queue adding it to Google Calendar if user has connected their account
+            from .outbox import enqueue_calendar_write
+            enqueue_calendar_write(task, 'upsert')
             
             return task
         except Exception as e:
@@ -233,25 +251,208 @@ class ChatbotHandler:
             raise ValueError(f"Couldn't create habit: {str(e)}")
 
     def _get_todays_tasks(self, user):
-        from django.utils import timezone
-        today = timezone.now().date()
-        tomorrow = today + timedelta(days=1)
+        # Read from the schedule digest rather than querying tasks
+        tasks = digest.due_today(user.id)
+        
+        if not tasks:
+            return "You have no tasks scheduled for today."
+        
+        lines = [f"- {title} (Due: {timezone.localtime(deadline).strftime('%I:%M %p')})" for title, deadline in tasks]
+        return "\nToday's tasks:\n" + "\n".join(lines) + "\n"
+    
+    def _find_open_tasks(self, title, user):
+        """Return up to two open tasks matching a title, exact matches first."""
+        tasks = Task.objects.filter(user=user, completed=False)
+        matches = list(tasks.filter(title__iexact=title)[:2])
+        # Partial matches on very short words would catch unrelated tasks
+        if not matches and len(title) >= 3:
+            matches = list(tasks.filter(title__icontains=title)[:2])
+        return matches
+    
+    def _format_datetime(self, value):
+        return timezone.localtime(value).strftime('%a %b %d, %I:%M %p')
+    
+    def _intent_due(self, params, user):
+        period = intents.due_range(params['when'], timezone.now())
+        if period is None:
+            return None
+        start, end, label = period
         
         tasks = Task.objects.filter(
             user=user,
-            deadline__gte=today,
-            deadline__lt=tomorrow,
-            completed=False
-        ).order_by('deadline')
+            completed=False,
+            deadline__gte=start,
+            deadline__lt=end
+        ).order_by('deadline').only('title', 'deadline')
         
         if not tasks:
-            return "You have no tasks scheduled for today."
+            return {'message': f"Nothing is due {label}."}
         
-        task_list = "\nToday's tasks:\n"
+        task_list = f"Due {label}:\n"
         for task in tasks:
-            task_list += f"- {task.title} (Due: {task.deadline.strftime('%I:%M %p')})\n"
+            task_list += f"- {task.title} (Due: {self._format_datetime(task.deadline)})\n"
+        return {'message': task_list}
+    
+    def _intent_complete(self, params, user):
+        tasks = self._find_open_tasks(params['title'], user)
+        if not tasks:
+            return None
+        if len(tasks) > 1:
+            return {'message': f"More than one open task matches '{params['title']}'. Which one do you mean?"}
         
-        return task_list
+        task = tasks[0]
+        task.completed = True
+        task.save()
+        
+        from .outbox import enqueue_calendar_write
+        enqueue_calendar_write(task, 'complete')
+        return {'message': f"Marked '{task.title}' as done."}
+    
+    def _intent_move(self, params, user):
+        tasks = self._find_open_tasks(params['title'], user)
+        if not tasks:
+            return None
+        if len(tasks) > 1:
+            return {'message': f"More than one open task matches '{params['title']}'. Which one do you mean?"}
+        
+        task = tasks[0]
+        if task.scheduled_time:
+            default_time = timezone.localtime(task.scheduled_time).time()
+        else:
+            from .utils import WORKING_START_HOUR
+            default_time = time(WORKING_START_HOUR)
+        new_scheduled_time = intents.parse_when(params['when'], timezone.now(), default_time=default_time)
+        if new_scheduled_time is None:
+            return None
+        
+        # The deadline moves with the task, as when dragging it on the calendar;
+        # a task that was never scheduled keeps its deadline
+        if task.scheduled_time and task.deadline:
+            task.deadline = task.deadline + (new_scheduled_time - task.scheduled_time)
+        task.scheduled_time = new_scheduled_time
+        task.save()
+        
+        from .outbox import enqueue_calendar_write
+        enqueue_calendar_write(task, 'upsert')
+        return {'message': f"Moved '{task.title}' to {self._format_datetime(new_scheduled_time)}."}
+    
+    def _intent_create(self, params, user):
+        from .utils import WORKING_END_HOUR
+        
+        # Deadlines without a time fall at the end of the working day
+        deadline = intents.parse_when(params['deadline'], timezone.now(), default_time=time(WORKING_END_HOUR))
+        if deadline is None:
+            return None
+        
+        duration = int(params['duration'])
+        if params['unit'].lower().startswith('h'):
+            duration *= 60
+        
+        task = self._create_task({
+            'title': params['title'],
+            'duration': duration,
+            'deadline': deadline,
+            'priority': intents.PRIORITIES.get(params.get('priority', '').lower(), 2),
+        }, user)
+        return {'message': f"Task created: {task.title} ({duration} min, due {self._format_datetime(task.deadline)})"}
+    
+    def _fast_path(self, user_message, user):
+        """Answer a message from the command grammar without the model. Returns None on a miss."""
+        matched = intents.match(user_message)
+        if matched is None:
+            return None
+        
+        intent, params = matched
+        response = getattr(self, f"_intent_{intent}")(params, user)
+        if response is not None:
+            intents.record_intent(intent)
+        return response
+    
+    def _is_general_question(self, user_message, user_state):
+        """Return True if the message isn't part of a flow or command and goes to the model."""
+        lowered = user_message.lower()
+        return not user_state and intents.match(user_message) is None and not any(
+            command in lowered for command in ('create task', 'create habit', 'today\'s task')
+        )
+    
+    def _build_prompt(self, user_message, user):
+        # Other questions leave the schedule out, so their answers are cached across users and days
+        if not intents.is_schedule_question(user_message):
+            return f"{self.system_prompt}\nUser: {user_message}"
+        
+        # Give the model the user's schedule so it can answer questions about it
+        schedule = digest.render_digest(user.id)
+        return f"{self.system_prompt}\n\nThe user's schedule:\n{schedule}\n\nUser: {user_message}"
+    
+    def _response_key(self, prompt):
+        prompt_hash = hashlib.sha256(normalize_prompt(prompt).encode()).hexdigest()
+        return f"chatbot_response_{prompt_hash}"
+    
+    def _ask_model(self, user_message, user):
+        """Return the model's answer to a general question, reusing cached and in-flight answers."""
+        prompt = self._build_prompt(user_message, user)
+        key = self._response_key(prompt)
+        response_cache = _response_cache()
+        
+        answer = response_cache.get(key)
+        if answer is not None:
+            return answer
+        
+        def generate():
+            answer = self.model.generate_content(prompt).text
+            if answer:
+                response_cache.set(key, answer, RESPONSE_CACHE_TIMEOUT)
+            return answer
+        
+        return _model_calls.run(key, generate)
+    
+    def stream_message(self, user_message, user):
+        """Yield the reply to a message as response dicts, streaming model output chunk by chunk.
+
+        Only general questions reach the model; everything else is answered
+        by process_message() in a single chunk.
+        """
+        user_message = user_message.strip()
+        if not self._is_general_question(user_message, self._get_user_state(user.id)):
+            yield self.process_message(user_message, user)
+            return
+        
+        try:
+            intents.record_intent(None)
+            prompt = self._build_prompt(user_message, user)
+            key = self._response_key(prompt)
+            response_cache = _response_cache()
+            
+            # A cached answer, or one another request is already generating, arrives as a single chunk
+            answer = response_cache.get(key)
+            if answer is None:
+                future, leader = _model_calls.claim(key)
+                if not leader:
+                    answer = future.result()
+            if answer is not None:
+                yield {'message': answer}
+                return
+            
+            chunks = []
+            try:
+                for chunk in self.model.generate_content(prompt, stream=True):
+                    if chunk.text:
+                        chunks.append(chunk.text)
+                        yield {'message': chunk.text}
+            except BaseException as e:
+                # Also reached when the client goes away mid-stream
+                if not isinstance(e, Exception):
+                    e = RuntimeError("The reply was interrupted")
+                _model_calls.resolve(key, exception=e)
+                raise
+            
+            answer = ''.join(chunks)
+            if answer:
+                response_cache.set(key, answer, RESPONSE_CACHE_TIMEOUT)
+            _model_calls.resolve(key, answer)
+        except Exception as e:
+            logger.error(f"Streaming error: {e}", exc_info=True)
+            yield {'error': str(e)}
         
     def process_message(self, user_message, user):
         try:
@@ -275,6 +476,11 @@ class ChatbotHandler:
             
             # Start new task/habit
             if not user_state:
+                # Answer common commands locally, without the model
+                fast_response = self._fast_path(user_message, user)
+                if fast_response is not None:
+                    return fast_response
+                
                 if 'create task' in user_message.lower():
                     user_state = {
                         'current_type': 'task',
@@ -302,9 +508,8 @@ class ChatbotHandler:
                 
                 # General question
                 else:
-                    prompt = f"{self.system_prompt}\nUser: {user_message}"
-                    response = self.model.generate_content(prompt)
-                    return {'message': response.text}
+                    intents.record_intent(None)
+                    return {'message': self._ask_model(user_message, user)}
             
             # Mid-creation flow
             else:
@@ -345,6 +550,32 @@ class ChatbotHandler:
             self._clear_user_state(user.id)
             return {'error': str(e)}
 
+def get_chatbot_handler():
+    """Return the process-wide ChatbotHandler, creating it on first use.
+
+    The handler keeps no per-user state (that lives in the cache), so one
+    configured client serves every request and thread.
+    """
+    global _handler
+    if _handler is None:
+        with _handler_lock:
+            if _handler is None:
+                model = None
+                if getattr(settings, 'CHATBOT_FAKE_MODEL', False):
+                    # Chat without a Gemini key during local development
+                    from .fakes import FakeGenerativeModel
+                    model = FakeGenerativeModel()
+                _handler = ChatbotHandler(model=model)
+    return _handler
+
+
+def warm_up_chatbot():
+    """Create the chatbot handler ahead of the first message, logging instead of raising."""
+    try:
+        get_chatbot_handler()
+    except Exception as e:
+        logger.warning(f"Chatbot warmup failed: {e}")
+
 @login_required
 def chatbot_view(request):
     if request.method == 'POST':
@@ -355,7 +586,7 @@ def chatbot_view(request):
                 return JsonResponse({'error': 'Message cannot be empty'}, status=400)
             
             # Process message
-            handler = ChatbotHandler()
+            handler = get_chatbot_handler()
             response = handler.process_message(user_message, request.user)
             return JsonResponse(response)
             
@@ -0,0 +1,161 @@
+"""Compact per-user schedule digest for the chatbot.
+
+The digest holds a user's open tasks, habits and recent habit completions in
+the cache. It is built from three queries and cached under the user's
+ScheduleVersion, which every change to their tasks, habits or completions
+bumps in the database, so a change made by any process retires it and the
+next message rebuilds it. Between changes, answering a chat message costs
+one small version query instead of a scan of the schedule.
+render_digest() turns the digest into a few lines of prompt text within a
+token budget.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Task, Habit, HabitCompletion, ScheduleVersion
+from .recurrence import occurrence_dates
+
+# Seconds a digest is kept; a version bump replaces it sooner
+DIGEST_TIMEOUT = 60 * 60 * 24
+
+# Days of completion history kept for streaks
+HISTORY_DAYS = 60
+
+# Rough prompt budget for the rendered digest
+DIGEST_TOKEN_BUDGET = getattr(settings, 'CHATBOT_DIGEST_TOKENS', 300)
+
+# Characters per token when estimating prompt size
+CHARS_PER_TOKEN = 4
+
+# Most overdue tasks listed by name; older ones are only counted
+OVERDUE_LIMIT = 5
+
+PRIORITY_LABELS = {1: 'high', 2: 'medium', 3: 'low'}
+
+
+def _key(user_id, version):
+    return f"chatbot_digest_{user_id}_{version}"
+
+
+def _aware(value):
+    # Tasks created by older chatbot code may carry naive datetimes
+    return timezone.make_aware(value) if timezone.is_naive(value) else value
+
+
+def build_digest(user_id):
+    """Build a user's digest from the database."""
+    since = timezone.localdate() - timedelta(days=HISTORY_DAYS)
+    digest = {
+        'tasks': {
+            pk: (title, _aware(deadline), priority)
+            for pk, title, deadline, priority in Task.objects.filter(
+                user_id=user_id,
+                completed=False
+            ).values_list('id', 'title', 'deadline', 'priority')
+        },
+        'habits': {
+            pk: (title, frequency, timezone.localtime(_aware(start_date)).date(), preferred_time)
+            for pk, title, frequency, start_date, preferred_time in Habit.objects.filter(
+                user_id=user_id
+            ).values_list('id', 'title', 'frequency', 'start_date', 'preferred_time')
+        },
+        'completions': {},
+    }
+    for habit_id, completed_date in HabitCompletion.objects.filter(
+        habit__user_id=user_id,
+        completed=True,
+        completed_date__gte=since
+    ).values_list('habit_id', 'completed_date'):
+        digest['completions'].setdefault(habit_id, set()).add(completed_date)
+    return digest
+
+
+def get_digest(user_id):
+    """Return a user's digest for their current schedule version, building it if it isn't cached."""
+    version = ScheduleVersion.objects.filter(user_id=user_id).values_list('version', flat=True).first() or 0
+    key = _key(user_id, version)
+    digest = cache.get(key)
+    if digest is None:
+        digest = build_digest(user_id)
+        cache.set(key, digest, DIGEST_TIMEOUT)
+    return digest
+
+
+def habit_streak(frequency, start_date, completed_dates, today):
+    """Count the habit's consecutive completed occurrences up to today.
+
+    Today's occurrence only breaks the streak once the day is over.
+    """
+    occurrences = occurrence_dates(frequency, start_date, today - timedelta(days=HISTORY_DAYS), today + timedelta(days=1))
+    streak = 0
+    for day in reversed(occurrences):
+        if day in completed_dates:
+            streak += 1
+        elif day != today:
+            break
+    return streak
+
+
+def due_today(user_id, now=None):
+    """Return (title, deadline) for the user's open tasks due today, soonest first."""
+    now = now or timezone.now()
+    today = timezone.localtime(now).date()
+    return sorted(
+        ((title, deadline) for title, deadline, priority in get_digest(user_id)['tasks'].values()
+         if timezone.localtime(deadline).date() == today),
+        key=lambda item: item[1]
+    )
+
+
+def _task_line(task):
+    title, deadline, priority = task
+    return f"- {title} (due {timezone.localtime(deadline):%a %b %d %H:%M}, {PRIORITY_LABELS.get(priority, 'medium')} priority)"
+
+
+def render_digest(user_id, now=None, budget=DIGEST_TOKEN_BUDGET):
+    """Render a user's digest as prompt lines, stopping at the token budget."""
+    now = now or timezone.now()
+    today = timezone.localtime(now).date()
+    digest = get_digest(user_id)
+
+    lines = [f"Today is {today:%A %B %d %Y}."]
+
+    habit_lines = []
+    for pk, (title, frequency, start_date, preferred_time) in sorted(digest['habits'].items(), key=lambda item: item[1][3]):
+        if today not in occurrence_dates(frequency, start_date, today, today + timedelta(days=1)):
+            continue
+        completed = digest['completions'].get(pk, set())
+        status = 'done' if today in completed else 'not done yet'
+        streak = habit_streak(frequency, start_date, completed, today)
+        habit_lines.append(f"- {title} at {preferred_time:%H:%M}, {status}, streak {streak}")
+    if habit_lines:
+        lines.append("Today's habits:")
+        lines.extend(habit_lines)
+
+    # Upcoming tasks come first so old overdue ones can't crowd them out of the budget
+    tasks = sorted(digest['tasks'].values(), key=lambda task: task[1])
+    upcoming = [task for task in tasks if task[1] >= now]
+    overdue = [task for task in reversed(tasks) if task[1] < now]
+    if upcoming:
+        lines.append("Upcoming tasks by deadline:")
+        lines.extend(_task_line(task) for task in upcoming)
+    if overdue:
+        lines.append("Overdue tasks, most recent first:")
+        lines.extend(_task_line(task) for task in overdue[:OVERDUE_LIMIT])
+        if len(overdue) > OVERDUE_LIMIT:
+            lines.append(f"- and {len(overdue) - OVERDUE_LIMIT} older overdue tasks")
+
+    # Keep whole lines while they fit the budget
+    limit = budget * CHARS_PER_TOKEN
+    kept = []
+    used = 0
+    for line in lines:
+        if used + len(line) + 1 > limit:
+            kept.append(f"... {len(lines) - len(kept)} more lines omitted")
+            break
+        kept.append(line)
+        used += len(line) + 1
+    return "\n".join(kept)
@@ -0,0 +1,221 @@
+"""In-memory stand-ins for external services (Google Calendar, Gemini), for tests and local development."""
+import copy
+import json
+import time
+from datetime import datetime
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+
+def _http_error(status, message):
+    resp = httplib2.Response({'status': status})
+    resp.reason = message
+    return HttpError(resp, json.dumps({'error': {'message': message}}).encode())
+
+
+def _parse_bound(value):
+    return datetime.fromisoformat((value.get('dateTime') or value['date']).replace('Z', '+00:00'))
+
+
+class FakeRequest:
+    """Deferred call that mimics googleapiclient's HttpRequest.execute()."""
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def execute(self):
+        return self.func(*self.args)
+
+
+class FakeBatchRequest:
+    """Mimics googleapiclient's BatchHttpRequest: one call, one callback per request."""
+
+    def __init__(self, service, callback=None):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        if request_id is None:
+            request_id = str(len(self.requests) + 1)
+        self.requests.append((request_id, request, callback or self.callback))
+
+    def execute(self):
+        self.service.calls.append(('batch', {'size': len(self.requests)}))
+        for request_id, request, callback in self.requests:
+            try:
+                response, exception = request.execute(), None
+            except HttpError as e:
+                response, exception = None, e
+            if callback is not None:
+                callback(request_id, response, exception)
+
+
+class FakeCalendarService:
+    """In-memory Google Calendar v3 service supporting the calls this app makes.
+
+    Every change is recorded in a changelog so that list() honours syncToken
+    the way the real API does: incremental lists return events changed since
+    the token, deleted events come back with status 'cancelled', and expired
+    tokens raise a 410 HttpError. Recurring events are not expanded.
+    """
+
+    def __init__(self, events=(), page_size=250):
+        self.page_size = page_size
+        self.calls = []
+        self._events = {}
+        self._changes = []
+        self._min_sync_token = 0
+        self._next_id = 1
+        for event in events:
+            self._insert(event)
+
+    def events(self):
+        return FakeEvents(self)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatchRequest(self, callback)
+
+    def expire_sync_tokens(self):
+        """Make every sync token handed out so far invalid."""
+        self._min_sync_token = len(self._changes) + 1
+
+    def _record(self, event_id):
+        self._changes.append(event_id)
+
+    def _get(self, event_id):
+        event = self._events.get(event_id)
+        if event is None or event['status'] == 'cancelled':
+            raise _http_error(404, 'Not Found')
+        return event
+
+    def _insert(self, body):
+        event = copy.deepcopy(body)
+        event.setdefault('id', f"fake{self._next_id}")
+        event.setdefault('status', 'confirmed')
+        self._next_id += 1
+        self._events[event['id']] = event
+        self._record(event['id'])
+        return copy.deepcopy(event)
+
+    def _update(self, event_id, body):
+        self._get(event_id)
+        event = copy.deepcopy(body)
+        event['id'] = event_id
+        event.setdefault('status', 'confirmed')
+        self._events[event_id] = event
+        self._record(event_id)
+        return copy.deepcopy(event)
+
+    def _patch(self, event_id, body):
+        event = self._get(event_id)
+        event.update(copy.deepcopy(body))
+        self._record(event_id)
+        return copy.deepcopy(event)
+
+    def _delete(self, event_id):
+        self._get(event_id)['status'] = 'cancelled'
+        self._record(event_id)
+        return ''
+
+    def _list(self, params):
+        sync_token = params.get('syncToken')
+        if sync_token is not None:
+            if int(sync_token) < self._min_sync_token:
+                raise _http_error(410, 'Sync token is no longer valid, a full sync is required.')
+            changed = dict.fromkeys(self._changes[int(sync_token):])
+            items = [self._events[event_id] for event_id in changed]
+        else:
+            items = [event for event in self._events.values() if event['status'] != 'cancelled']
+            if params.get('timeMin'):
+                time_min = datetime.fromisoformat(params['timeMin'])
+                items = [event for event in items if _parse_bound(event['end']) > time_min]
+            if params.get('timeMax'):
+                time_max = datetime.fromisoformat(params['timeMax'])
+                items = [event for event in items if _parse_bound(event['start']) < time_max]
+            items.sort(key=lambda event: _parse_bound(event['start']))
+
+        offset = int(params.get('pageToken') or 0)
+        page_size = min(params.get('maxResults', self.page_size), self.page_size)
+        result = {'items': copy.deepcopy(items[offset:offset + page_size])}
+        if offset + page_size < len(items):
+            result['nextPageToken'] = str(offset + page_size)
+        else:
+            result['nextSyncToken'] = str(len(self._changes))
+        return result
+
+
+class FakeEvents:
+    """The events() collection of FakeCalendarService."""
+
+    def __init__(self, service):
+        self.service = service
+
+    def _call(self, method, func, *args, **params):
+        self.service.calls.append((method, params))
+        return FakeRequest(func, *args)
+
+    def list(self, **params):
+        return self._call('list', self.service._list, params, **params)
+
+    def get(self, calendarId, eventId):
+        return self._call('get', lambda: copy.deepcopy(self.service._get(eventId)), eventId=eventId)
+
+    def insert(self, calendarId, body):
+        return self._call('insert', self.service._insert, body, body=body)
+
+    def update(self, calendarId, eventId, body):
+        return self._call('update', self.service._update, eventId, body, eventId=eventId, body=body)
+
+    def patch(self, calendarId, eventId, body):
+        return self._call('patch', self.service._patch, eventId, body, eventId=eventId, body=body)
+
+    def delete(self, calendarId, eventId):
+        return self._call('delete', self.service._delete, eventId, eventId=eventId)
+
+
+class FakeContentChunk:
+    """One chunk of a generate_content() response."""
+
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerateContentResponse:
+    """Mimics google.generativeai's GenerateContentResponse, streamed or not."""
+
+    def __init__(self, chunks, delay=0):
+        self.chunks = chunks
+        self.delay = delay
+
+    @property
+    def text(self):
+        return ''.join(self.chunks)
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            if self.delay:
+                time.sleep(self.delay)
+            yield FakeContentChunk(chunk)
+
+
+class FakeGenerativeModel:
+    """Stand-in for google.generativeai.GenerativeModel that replies with canned text.
+
+    The reply is split into chunks of chunk_size characters, each streamed
+    after an optional delay in seconds. Every prompt is recorded in .prompts.
+    """
+
+    def __init__(self, reply="This is a reply from the fake model.", chunk_size=8, delay=0):
+        self.reply = reply
+        self.chunk_size = chunk_size
+        self.delay = delay
+        self.prompts = []
+
+    def generate_content(self, prompt, stream=False):
+        self.prompts.append(prompt)
+        reply = self.reply(prompt) if callable(self.reply) else self.reply
+        chunks = [reply[i:i + self.chunk_size] for i in range(0, len(reply), self.chunk_size)]
+        return FakeGenerateContentResponse(chunks, self.delay if stream else 0)
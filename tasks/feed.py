@@ -0,0 +1,215 @@
+"""Calendar feed serialization.
+
+Builds the event rows behind the calendar API from column projections
+(values_list) instead of model instances, and formats timestamps by slicing
+one isoformat() string per event. Rows can be emitted either as the classic
+list of event objects or as a compact array-of-arrays payload with a single
+field header. orjson is used to encode the payload when it is installed.
+
+Month rows are cached per user under the user's ScheduleVersion, which
+every change bumps in the database. A new version is a new key, so a
+change made by any process, including the management commands, is seen
+by every process without a shared cache backend. A request racing with a
+change stores its rows under the old version, which is never read again.
+
+Invalidation is per user, not per month: any change retires all of the
+user's cached months. Month-scoped counters would have to live in a shared
+cache or the database for changes made outside the web process to reach
+it. The version already lives in the database, and rebuilding a month
+costs three queries.
+"""
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from .models import Task, Habit, HabitCompletion
+from .recurrence import expand_habits
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Column order of every event row
+EVENT_FIELDS = (
+    'id', 'title', 'date', 'date_ymd', 'time', 'type', 'priority',
+    'completed', 'description', 'duration', 'deadline', 'frequency',
+)
+
+# Fields each event type carries in the object format
+TASK_EVENT_FIELDS = (
+    'id', 'title', 'date', 'date_ymd', 'time', 'type', 'priority',
+    'completed', 'description', 'duration', 'deadline',
+)
+HABIT_EVENT_FIELDS = (
+    'id', 'title', 'date', 'time', 'type', 'completed', 'description',
+    'duration', 'frequency',
+)
+
+_FIELD_INDEX = {name: index for index, name in enumerate(EVENT_FIELDS)}
+
+# Seconds a cached month is kept; a version bump replaces it sooner
+CALENDAR_CACHE_TIMEOUT = getattr(settings, 'CALENDAR_CACHE_TIMEOUT', 60 * 60 * 24)
+
+# Longest range, in days, the range API serves in one request
+MAX_RANGE_DAYS = getattr(settings, 'CALENDAR_MAX_RANGE_DAYS', 366)
+
+# Ranges longer than this many days are streamed instead of built in memory
+STREAM_RANGE_DAYS = 62
+
+# Events encoded per streamed chunk
+STREAM_CHUNK_SIZE = 500
+
+
+def iter_task_rows(user, start, end):
+    """Yield event rows for the user's tasks scheduled in [start, end)."""
+    tasks = Task.objects.filter(
+        user=user,
+        scheduled_time__gte=start,
+        scheduled_time__lt=end
+    ).values_list(
+        'id', 'title', 'scheduled_time', 'priority', 'completed',
+        'description', 'duration', 'deadline'
+    ).iterator(chunk_size=STREAM_CHUNK_SIZE)
+
+    for pk, title, scheduled_time, priority, completed, description, duration, deadline in tasks:
+        # One isoformat() per timestamp; the date and time are slices of it
+        scheduled = scheduled_time.isoformat()
+        yield (
+            pk, title, scheduled, scheduled[:10], scheduled[11:16], 'task', priority,
+            completed, description, duration, deadline.isoformat() if deadline else None, None
+        )
+
+
+def iter_habit_rows(user, start, end):
+    """Yield event rows for every occurrence of the user's habits in [start, end)."""
+    habits = Habit.objects.filter(user=user).only(
+        'id', 'title', 'description', 'duration', 'frequency', 'preferred_time', 'start_date'
+    )
+
+    # Fetch every completion for the range in one query
+    completions = {
+        (habit_id, completed_date): completed
+        for habit_id, completed_date, completed in HabitCompletion.objects.filter(
+            habit__user=user,
+            completed_date__gte=start.date(),
+            completed_date__lt=end.date()
+        ).values_list('habit_id', 'completed_date', 'completed')
+    }
+
+    tz = timezone.get_current_timezone()
+    stamps = {}
+    labels = {}
+    for habit, occurrence_date in expand_habits(habits, start.date(), end.date()):
+        # Habits sharing a date and preferred time share one formatted timestamp
+        key = (occurrence_date, habit.preferred_time)
+        if key not in stamps:
+            stamps[key] = timezone.datetime.combine(occurrence_date, habit.preferred_time, tzinfo=tz).isoformat()
+        if habit.pk not in labels:
+            labels[habit.pk] = habit.get_frequency_display()
+        stamp = stamps[key]
+        yield (
+            habit.pk, habit.title, stamp, None, stamp[11:16], 'habit', None,
+            completions.get((habit.pk, occurrence_date), False), habit.description,
+            habit.duration, None, labels[habit.pk]
+        )
+
+
+def iter_calendar_rows(user, start, end):
+    """Yield every task and habit event row for the user in [start, end).
+
+    Tasks come from one query and habits and completions from one each.
+    """
+    yield from iter_task_rows(user, start, end)
+    yield from iter_habit_rows(user, start, end)
+
+
+def calendar_rows(user, start, end):
+    """Return every task and habit event row for the user in [start, end)."""
+    return list(iter_calendar_rows(user, start, end))
+
+
+def month_bounds(year, month):
+    """Return the aware [start, end) datetimes of a month in the current timezone."""
+    tz = timezone.get_current_timezone()
+    start = timezone.datetime(year, month, 1, tzinfo=tz)
+    if month == 12:
+        end = timezone.datetime(year + 1, 1, 1, tzinfo=tz)
+    else:
+        end = timezone.datetime(year, month + 1, 1, tzinfo=tz)
+    return start, end
+
+
+def month_rows(user, year, month, version):
+    """Return the user's event rows for a month, cached under their schedule version."""
+    key = f"calendar-rows:{user.id}:{year}-{month}:{version}"
+    rows = cache.get(key)
+    if rows is None:
+        start, end = month_bounds(year, month)
+        rows = calendar_rows(user, start, end)
+        cache.set(key, rows, CALENDAR_CACHE_TIMEOUT)
+    return rows
+
+
+def iter_events(rows):
+    """Turn event rows into the event objects the calendar page reads."""
+    task_fields = [(name, _FIELD_INDEX[name]) for name in TASK_EVENT_FIELDS]
+    habit_fields = [(name, _FIELD_INDEX[name]) for name in HABIT_EVENT_FIELDS]
+    type_index = _FIELD_INDEX['type']
+
+    for row in rows:
+        fields = task_fields if row[type_index] == 'task' else habit_fields
+        yield {name: row[index] for name, index in fields}
+
+
+def rows_to_events(rows):
+    """Return the list of event objects for event rows."""
+    return list(iter_events(rows))
+
+
+def feed_payload(rows, compact=False):
+    """Build the response payload for event rows, optionally as arrays with a field header."""
+    if compact:
+        return {'fields': EVENT_FIELDS, 'events': rows}
+    return {'events': rows_to_events(rows)}
+
+
+def dumps(payload):
+    """Encode a payload as JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(',', ':')).encode()
+
+
+def json_response(payload, **kwargs):
+    """Return an application/json response for a payload."""
+    return HttpResponse(dumps(payload), content_type='application/json', **kwargs)
+
+
+def stream_payload(rows, compact=False):
+    """Yield the payload for event rows as JSON byte chunks, encoding a chunk of events at a time."""
+    if compact:
+        yield b'{"fields":' + dumps(EVENT_FIELDS) + b',"events":['
+        items = iter(rows)
+    else:
+        yield b'{"events":['
+        items = iter_events(rows)
+
+    separator = b''
+    while True:
+        chunk = list(islice(items, STREAM_CHUNK_SIZE))
+        if not chunk:
+            break
+        # Encode the chunk as one array and drop its brackets
+        yield separator + dumps(chunk)[1:-1]
+        separator = b','
+    yield b']}'
+
+
+def streaming_json_response(rows, compact=False, **kwargs):
+    """Return an application/json response that streams the payload for event rows."""
+    return StreamingHttpResponse(stream_payload(rows, compact), content_type='application/json', **kwargs)
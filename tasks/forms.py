@@ -1,7 +1,12 @@
+from datetime import datetime, time, timedelta
 from django import forms
+from django.utils import timezone
 from .models import Task, Habit
 
 class TaskForm(forms.ModelForm):
+    # Start time picked from the suggested slots; scheduled automatically when empty
+    scheduled_slot = forms.DateTimeField(required=False, widget=forms.HiddenInput)
+    
     class Meta:
         model = Task
         fields = ['title', 'description', 'duration', 'deadline', 'priority']
@@ -9,6 +14,32 @@ class TaskForm(forms.ModelForm):
             'deadline': forms.DateTimeInput(attrs={'type': 'datetime-local'}),
             'description': forms.Textarea(attrs={'rows': 3}),
         }
+    
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Whose tasks and calendar a chosen slot is checked against
+        self.user = user
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        slot = cleaned_data.get('scheduled_slot')
+        duration = cleaned_data.get('duration')
+        deadline = cleaned_data.get('deadline')
+        if not slot or not duration:
+            return cleaned_data
+        
+        slot_end = slot + timedelta(minutes=duration)
+        # Suggestions go stale while the form is open, so check the slot again
+        if slot < timezone.now():
+            self.add_error(None, 'The chosen time slot has already started. Pick another slot.')
+        elif deadline and slot_end > deadline:
+            self.add_error(None, 'The chosen time slot ends after the deadline. Pick another slot.')
+        elif self.user is not None:
+            from .utils import get_user_busy_periods
+            exclude_task = self.instance if self.instance.pk else None
+            if get_user_busy_periods(self.user, slot, slot_end, exclude_task):
+                self.add_error(None, 'The chosen time slot is no longer free. Pick another slot.')
+        return cleaned_data
 
 class HabitForm(forms.ModelForm):
     class Meta:
@@ -18,4 +49,44 @@ class HabitForm(forms.ModelForm):
             'start_date': forms.DateTimeInput(attrs={'type': 'datetime-local'}),
             'preferred_time': forms.TimeInput(attrs={'type': 'time'}),
             'description': forms.Textarea(attrs={'rows': 3}),
-        }
\ No newline at end of file
+        }
+
+class TaskFilterForm(forms.Form):
+    completed = forms.NullBooleanField(
+        required=False,
+        widget=forms.Select(
+            choices=[('', 'All tasks'), ('false', 'Open'), ('true', 'Completed')],
+            attrs={'class': 'form-select'}
+        )
+    )
+    priority = forms.TypedChoiceField(
+        choices=[('', 'Any priority')] + Task.PRIORITY_CHOICES,
+        coerce=int,
+        required=False,
+        empty_value=None,
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    deadline_after = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
+    deadline_before = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
+    
+    def filter(self, queryset):
+        """Apply the valid filters to a Task queryset."""
+        self.is_valid()
+        data = self.cleaned_data
+        
+        # Deliberately not completed=...: Django writes that as a bare "WHERE completed"
+        # (or "NOT completed"), which SQLite can't match against the completed column of
+        # task_user_status_created_idx, so it would scan every row of the user. An IN list
+        # is compared as an equality and uses the index. IndexUsageTests checks the plan.
+        if data.get('completed') is not None:
+            queryset = queryset.filter(completed__in=[data['completed']])
+        if data.get('priority'):
+            queryset = queryset.filter(priority=data['priority'])
+        # Compare against datetimes rather than deadline__date so the index is usable
+        if data.get('deadline_after'):
+            start = timezone.make_aware(datetime.combine(data['deadline_after'], time.min))
+            queryset = queryset.filter(deadline__gte=start)
+        if data.get('deadline_before'):
+            end = timezone.make_aware(datetime.combine(data['deadline_before'] + timedelta(days=1), time.min))
+            queryset = queryset.filter(deadline__lt=end)
+        return queryset
@@ -0,0 +1,78 @@
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+
+
+class BusyIndex:
+    """Sorted, merged busy intervals."""
+
+    def __init__(self, periods=()):
+        self.starts = []
+        self.ends = []
+
+        # Merge overlapping or touching periods so the intervals are disjoint
+        # and both the start and end lists stay sorted
+        for start, end in sorted(periods):
+            if self.ends and start <= self.ends[-1]:
+                if end > self.ends[-1]:
+                    self.ends[-1] = end
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        return zip(self.starts, self.ends)
+
+    def add(self, start, end):
+        """Mark [start, end) as busy, merging it with any intervals it touches."""
+        i = bisect_left(self.ends, start)
+        j = bisect_right(self.starts, end)
+        if i < j:
+            start = min(start, self.starts[i])
+            end = max(end, self.ends[j - 1])
+        self.starts[i:j] = [start]
+        self.ends[i:j] = [end]
+
+
+def working_windows(start, end, working_start_hour, working_end_hour):
+    """Yield the weekday working-hour windows that fall inside [start, end)."""
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day < end:
+        # Skip weekends (5=Saturday, 6=Sunday)
+        if day.weekday() < 5:
+            window_start = max(start, day.replace(hour=working_start_hour))
+            window_end = min(end, day.replace(hour=working_end_hour))
+            if window_start < window_end:
+                yield window_start, window_end
+        day += timedelta(days=1)
+
+
+def free_gaps(busy, start, end, working_start_hour, working_end_hour):
+    """Return the free (start, end) gaps inside working hours between start and end.
+
+    The working-hour windows and the busy intervals are both sorted, so the
+    gaps come out of a single sweep over the two lists.
+    """
+    gaps = []
+    count = len(busy.starts)
+    i = bisect_right(busy.ends, start)
+
+    for window_start, window_end in working_windows(start, end, working_start_hour, working_end_hour):
+        # Skip busy intervals that finished before this window opened
+        while i < count and busy.ends[i] <= window_start:
+            i += 1
+
+        cursor = window_start
+        j = i
+        while j < count and busy.starts[j] < window_end:
+            if busy.starts[j] > cursor:
+                gaps.append((cursor, busy.starts[j]))
+            cursor = max(cursor, busy.ends[j])
+            j += 1
+
+        if cursor < window_end:
+            gaps.append((cursor, window_end))
+
+    return gaps
@@ -0,0 +1,171 @@
+"""Command grammar for the chatbot's local fast path.
+
+Common requests ("what's due tomorrow", "mark X done", "move X to Friday",
+"create task X 30 min by Friday high") are matched against precompiled
+patterns and answered from the database by ChatbotHandler, so only messages
+that match nothing cost a Gemini round trip. Fast-path hits and model
+escalations are counted in the cache; intent_stats() reports them at
+/chatbot/stats/ for staff.
+"""
+import logging
+import re
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = {
+    'mon': 0, 'monday': 0, 'tue': 1, 'tues': 1, 'tuesday': 1, 'wed': 2, 'wednesday': 2,
+    'thu': 3, 'thur': 3, 'thurs': 3, 'thursday': 3, 'fri': 4, 'friday': 4,
+    'sat': 5, 'saturday': 5, 'sun': 6, 'sunday': 6,
+}
+
+PRIORITIES = {'high': 1, 'medium': 2, 'low': 3}
+
+# (intent, pattern) pairs, tried in order
+GRAMMAR = [
+    ('due', re.compile(
+        r"^(?:what(?:'s|\s+is|\s+are)?|show(?:\s+me)?|list)\s+(?:(?:my|the)\s+)?(?:tasks?\s+)?"
+        r"(?:due|scheduled)\s+(?:on\s+|for\s+)?(?P<when>.+?)\s*\??$",
+        re.IGNORECASE
+    )),
+    ('complete', re.compile(
+        r"^(?:mark|set)\s+(?P<title>.+?)\s+(?:as\s+)?(?:done|complete|completed|finished)\s*[.!]?$",
+        re.IGNORECASE
+    )),
+    ('move', re.compile(
+        r"^(?:move|reschedule|push|shift)\s+(?P<title>.+?)\s+to\s+(?P<when>.+?)\s*[.!]?$",
+        re.IGNORECASE
+    )),
+    ('create', re.compile(
+        r"^(?:create|add|new)\s+(?:a\s+)?task\s+(?P<title>.+?)\s+(?:for\s+)?(?P<duration>\d+)\s*(?P<unit>m|mins?|minutes?|h|hrs?|hours?)"
+        r"\s+(?:by|due)\s+(?P<deadline>.+?)(?:\s+(?P<priority>high|medium|low)(?:\s+priority)?)?\s*[.!]?$",
+        re.IGNORECASE
+    )),
+]
+
+# Words that make a general question about the user's own schedule
+_SCHEDULE_QUESTION_RE = re.compile(
+    r"\b(?:schedule|agenda|calendar|today|tonight|tomorrow|week(?:end)?|due|overdue|deadlines?|streaks?|"
+    r"upcoming|free|busy|my\s+(?:tasks?|habits?|day|plans?)|what\s+should\s+i)\b",
+    re.IGNORECASE
+)
+
+_TITLE_PREFIX_RE = re.compile(r"^(?:the\s+)?(?:task\s+)?", re.IGNORECASE)
+_DAY_PREFIX_RE = re.compile(r"^(?:on|this|next|by)\s+", re.IGNORECASE)
+_TIME_RE = re.compile(
+    r"(?:^|\s+)(?:at\s+)?(?P<hour>\d{1,2})(?::(?P<minute>\d{2}))?\s*(?P<meridiem>am|pm)?$",
+    re.IGNORECASE
+)
+
+
+def match(message):
+    """Return (intent, params) for the first grammar rule the message matches, or None."""
+    message = message.strip()
+    for intent, pattern in GRAMMAR:
+        found = pattern.match(message)
+        if found:
+            params = {key: value for key, value in found.groupdict().items() if value is not None}
+            if 'title' in params:
+                params['title'] = _TITLE_PREFIX_RE.sub('', params['title']).strip('"\'')
+            return intent, params
+    return None
+
+
+def is_schedule_question(message):
+    """Return True if a general question is about the user's own tasks, habits or time."""
+    return _SCHEDULE_QUESTION_RE.search(message) is not None
+
+
+def split_time(text):
+    """Split a trailing time of day off a phrase. Returns (rest, time or None)."""
+    found = _TIME_RE.search(text)
+    # A bare number is a day ("oct 30"), not a time
+    if not found or not (found.group('minute') or found.group('meridiem')):
+        return text, None
+
+    hour = int(found.group('hour'))
+    minute = int(found.group('minute') or 0)
+    meridiem = (found.group('meridiem') or '').lower()
+    if meridiem == 'pm' and hour < 12:
+        hour += 12
+    elif meridiem == 'am' and hour == 12:
+        hour = 0
+    if hour > 23 or minute > 59:
+        return text, None
+    return text[:found.start()].strip(), time(hour, minute)
+
+
+def parse_day(text, today):
+    """Return the date a phrase like "tomorrow", "next friday" or "Oct 30" refers to, or None."""
+    text = text.strip().lower()
+    if text in ('today', 'tonight'):
+        return today
+    if text == 'tomorrow':
+        return today + timedelta(days=1)
+
+    weekday = WEEKDAYS.get(_DAY_PREFIX_RE.sub('', text))
+    if weekday is not None:
+        # The coming one, never today
+        return today + timedelta(days=(weekday - today.weekday()) % 7 or 7)
+
+    import dateparser
+    parsed = dateparser.parse(text, languages=['en'], settings={'PREFER_DATES_FROM': 'future'})
+    return parsed.date() if parsed else None
+
+
+def parse_when(text, now, default_time=None):
+    """Return the aware datetime a phrase like "friday 3pm" refers to, or None.
+
+    Without a time in the phrase, default_time (or midnight) is used.
+    """
+    day_text, time_of_day = split_time(text)
+    day = parse_day(day_text, timezone.localtime(now).date()) if day_text else timezone.localtime(now).date()
+    if day is None:
+        return None
+    return timezone.make_aware(datetime.combine(day, time_of_day or default_time or time()))
+
+
+def due_range(text, now):
+    """Return (start, end, label) of the period a due-date question asks about, or None."""
+    today = timezone.localtime(now).date()
+    text = text.strip().lower()
+    if text in ('this week', 'the week'):
+        start, end = today, today + timedelta(days=7 - today.weekday())
+    elif text == 'next week':
+        start = today + timedelta(days=7 - today.weekday())
+        end = start + timedelta(days=7)
+    else:
+        start = parse_day(text, today)
+        if start is None:
+            return None
+        end = start + timedelta(days=1)
+    return (
+        timezone.make_aware(datetime.combine(start, time())),
+        timezone.make_aware(datetime.combine(end, time())),
+        text
+    )
+
+
+def record_intent(intent):
+    """Count a fast-path hit for an intent, or a model escalation when intent is None."""
+    key = f"chatbot_intent:{intent or 'model'}"
+    try:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+    except Exception as e:
+        logger.error(f"Intent metrics error: {e}")
+
+
+def intent_stats():
+    """Return fast-path hit counts per intent, model escalations and the hit rate."""
+    names = [intent for intent, pattern in GRAMMAR]
+    names = list(dict.fromkeys(names)) + ['model']
+    counts = cache.get_many([f"chatbot_intent:{name}" for name in names])
+    stats = {name: counts.get(f"chatbot_intent:{name}", 0) for name in names}
+    hits = sum(count for name, count in stats.items() if name != 'model')
+    total = hits + stats['model']
+    stats['hit_rate'] = hits / total if total else 0.0
+    return stats
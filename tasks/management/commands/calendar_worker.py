@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tasks.outbox import process_calendar_outbox
+
+
+class Command(BaseCommand):
+    help = "Apply queued Google Calendar writes from the outbox in a loop."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process the due entries once and exit')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep when the outbox is empty')
+        parser.add_argument('--batch-size', type=int, default=100, help='Entries to process per pass')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_calendar_outbox(limit=options['batch_size'])
+            if processed:
+                self.stdout.write(f"Processed {processed} calendar write(s)")
+            if options['once']:
+                return
+            if processed < options['batch_size']:
+                time.sleep(options['interval'])
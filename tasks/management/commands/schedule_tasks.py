@@ -0,0 +1,27 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from tasks.utils import schedule_user_tasks
+
+
+class Command(BaseCommand):
+    help = "Re-plan every incomplete task for the given users in a single pass."
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help='Users to re-plan')
+        parser.add_argument('--all', action='store_true', help='Re-plan tasks for every user')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            users = User.objects.filter(tasks__completed=False).distinct()
+        elif options['usernames']:
+            users = User.objects.filter(username__in=options['usernames'])
+            missing = set(options['usernames']) - {user.username for user in users}
+            if missing:
+                raise CommandError(f"Unknown users: {', '.join(sorted(missing))}")
+        else:
+            raise CommandError("Pass one or more usernames or --all")
+
+        for user in users:
+            changed = schedule_user_tasks(user)
+            self.stdout.write(f"{user.username}: rescheduled {len(changed)} task(s)")
@@ -0,0 +1,23 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from tasks.utils import sync_calendar_events
+
+
+class Command(BaseCommand):
+    help = "Incrementally sync the local Google Calendar mirror for connected users."
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help='Users to sync (default: every Google-connected user)')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(socialaccount__provider='google').distinct()
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+
+        for user in users:
+            try:
+                sync_calendar_events(user, force=True)
+                self.stdout.write(f"{user.username}: synced")
+            except Exception as e:
+                self.stderr.write(f"{user.username}: sync failed: {e}")
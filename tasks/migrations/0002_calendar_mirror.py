@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalendarSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sync_token', models.CharField(blank=True, max_length=255, null=True)),
+                ('synced_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='calendar_sync_state', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CalendarEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('google_event_id', models.CharField(max_length=255)),
+                ('summary', models.CharField(blank=True, max_length=255)),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('all_day', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calendar_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'start', 'end'], name='tasks_calen_user_id_e7c876_idx')],
+                'unique_together': {('user', 'google_event_id')},
+            },
+        ),
+    ]
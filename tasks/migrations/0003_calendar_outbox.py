@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:20
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0002_calendar_mirror'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalendarOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('task', 'Task'), ('habit', 'Habit')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('operation', models.CharField(choices=[('upsert', 'Create or update'), ('complete', 'Update completion colour'), ('delete', 'Delete')], max_length=10)),
+                ('google_event_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calendar_outbox', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['next_attempt_at'], name='tasks_calen_next_at_313fe4_idx')],
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0003_calendar_outbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(fields=['user', '-created_at'], name='habit_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('completed', False)), fields=['user', 'deadline'], name='task_user_open_deadline_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['user', 'scheduled_time'], name='task_user_scheduled_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['user', '-created_at'], name='task_user_created_idx'),
+        ),
+    ]
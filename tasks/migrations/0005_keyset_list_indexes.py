@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0004_task_habit_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='habit',
+            name='habit_user_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='task',
+            name='task_user_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='habit_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='task_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['user', 'completed', '-created_at', '-id'], name='task_user_status_created_idx'),
+        ),
+    ]
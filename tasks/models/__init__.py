@@ -4,6 +4,7 @@
 # Import the models directly
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 # Define Task model
 class Task(models.Model):
@@ -25,6 +26,21 @@ class Task(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # Open tasks by deadline (home page, chatbot "today's tasks")
+            models.Index(
+                fields=['user', 'deadline'],
+                condition=models.Q(completed=False),
+                name='task_user_open_deadline_idx'
+            ),
+            # Calendar views by scheduled time
+            models.Index(fields=['user', 'scheduled_time'], name='task_user_scheduled_idx'),
+            # Task list, newest first, optionally filtered by status
+            models.Index(fields=['user', '-created_at', '-id'], name='task_user_created_idx'),
+            models.Index(fields=['user', 'completed', '-created_at', '-id'], name='task_user_status_created_idx'),
+        ]
+    
     def __str__(self):
         return self.title
 
@@ -47,6 +63,12 @@ class Habit(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # Habit list, newest first
+            models.Index(fields=['user', '-created_at', '-id'], name='habit_user_created_idx'),
+        ]
+    
     def __str__(self):
         return self.title
 
@@ -57,7 +79,86 @@ class HabitCompletion(models.Model):
     completed = models.BooleanField(default=True)
     
     class Meta:
+        # Also serves completion lookups by habit and date range
         unique_together = ('habit', 'completed_date')
         
     def __str__(self):
-        return f"{self.habit.title} - {self.completed_date}"
\ No newline at end of file
+        return f"{self.habit.title} - {self.completed_date}"
+
+
+# Define CalendarEvent model
+class CalendarEvent(models.Model):
+    """Local mirror of a Google Calendar event, kept current by incremental sync."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='calendar_events')
+    google_event_id = models.CharField(max_length=255)
+    summary = models.CharField(max_length=255, blank=True)
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    all_day = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ('user', 'google_event_id')
+        indexes = [
+            models.Index(fields=['user', 'start', 'end']),
+        ]
+        
+    def __str__(self):
+        return f"{self.summary} ({self.start:%Y-%m-%d %H:%M})"
+
+# Define CalendarSyncState model
+class CalendarSyncState(models.Model):
+    """Google Calendar sync token and last sync time for a user."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='calendar_sync_state')
+    sync_token = models.CharField(max_length=255, blank=True, null=True)
+    synced_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.user} - {self.synced_at}"
+
+
+# Define ScheduleVersion model
+class ScheduleVersion(models.Model):
+    """Per-user change counter for tasks, habits and completions, used for calendar ETags."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='schedule_version')
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"{self.user} - v{self.version}"
+
+
+# Define CalendarOutbox model
+class CalendarOutbox(models.Model):
+    """Pending Google Calendar write for a task or habit, applied by the calendar worker."""
+    KIND_CHOICES = [
+        ('task', 'Task'),
+        ('habit', 'Habit'),
+    ]
+    
+    OPERATION_CHOICES = [
+        ('upsert', 'Create or update'),
+        ('complete', 'Update completion colour'),
+        ('delete', 'Delete'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='calendar_outbox')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    operation = models.CharField(max_length=10, choices=OPERATION_CHOICES)
+    google_event_id = models.CharField(max_length=255, blank=True, null=True)
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        # One pending write per object; new writes are coalesced into it
+        unique_together = ('kind', 'object_id')
+        indexes = [
+            models.Index(fields=['next_attempt_at']),
+        ]
+        
+    def __str__(self):
+        return f"{self.operation} {self.kind} {self.object_id}"
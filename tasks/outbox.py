@@ -0,0 +1,249 @@
+"""Durable outbox for Google Calendar writes.
+
+Views record the calendar change they need in CalendarOutbox instead of
+calling Google inside the request. The calendar_worker management command
+applies pending rows in the background with retries, grouping each user's
+writes into Calendar API batch requests. Writes for the same task or habit
+are coalesced into one row, so create + edit + complete becomes a single
+calendar write.
+"""
+import logging
+from datetime import timedelta
+
+from allauth.socialaccount.models import SocialAccount
+from django.db import transaction
+from django.utils import timezone
+from googleapiclient.errors import HttpError
+
+from .models import Task, Habit, CalendarOutbox
+from .utils import (
+    get_calendar_service, task_event_body, task_event_colour, habit_event_body,
+    mirror_calendar_event, mark_calendar_stale, forget_calendar_event, delete_calendar_event,
+)
+
+logger = logging.getLogger(__name__)
+
+# Give up on a write after this many failed attempts
+MAX_ATTEMPTS = 8
+
+# Calendar API requests per HTTP batch call
+BATCH_SIZE = 50
+
+# Retry delays double from this base up to the cap
+RETRY_BASE_DELAY = timedelta(seconds=30)
+RETRY_MAX_DELAY = timedelta(hours=1)
+
+
+def _kind_of(obj):
+    return 'task' if isinstance(obj, Task) else 'habit'
+
+
+def _coalesce(pending, operation, google_event_id):
+    """Merge a new operation into a pending one. Returns None if nothing is left to do."""
+    if operation == 'delete':
+        # A create that never reached Google cancels out with the delete
+        if not (google_event_id or pending.google_event_id):
+            return None
+        return 'delete'
+    if operation == 'complete' and pending.operation == 'upsert':
+        # The full update already carries the completion colour
+        return 'upsert'
+    return operation
+
+
+def enqueue_calendar_writes(objs, operation):
+    """Queue a calendar write for each task or habit, coalescing with pending writes.
+
+    Objects whose owner has no Google account connected are skipped. Call
+    this before deleting objects, so their event ids are captured.
+    """
+    objs = list(objs)
+    if not objs:
+        return
+
+    connected = set(SocialAccount.objects.filter(
+        user_id__in={obj.user_id for obj in objs},
+        provider='google'
+    ).values_list('user_id', flat=True))
+    objs = [obj for obj in objs if obj.user_id in connected]
+    if not objs:
+        return
+
+    now = timezone.now()
+    with transaction.atomic():
+        pending = {}
+        for kind in {_kind_of(obj) for obj in objs}:
+            rows = CalendarOutbox.objects.select_for_update().filter(
+                kind=kind,
+                object_id__in=[obj.pk for obj in objs if _kind_of(obj) == kind]
+            )
+            pending.update(((row.kind, row.object_id), row) for row in rows)
+
+        to_create = []
+        to_update = []
+        to_delete = []
+        for obj in objs:
+            kind = _kind_of(obj)
+            row = pending.get((kind, obj.pk))
+
+            if row is None:
+                # Nothing to change for objects that never reached the calendar
+                if operation != 'upsert' and not obj.google_event_id:
+                    continue
+                to_create.append(CalendarOutbox(
+                    user_id=obj.user_id,
+                    kind=kind,
+                    object_id=obj.pk,
+                    operation=operation,
+                    google_event_id=obj.google_event_id,
+                    next_attempt_at=now
+                ))
+                continue
+
+            merged = _coalesce(row, operation, obj.google_event_id)
+            if merged is None:
+                to_delete.append(row.pk)
+                continue
+            row.operation = merged
+            row.google_event_id = obj.google_event_id or row.google_event_id
+            row.attempts = 0
+            row.next_attempt_at = now
+            row.last_error = ''
+            row.updated_at = now
+            to_update.append(row)
+
+        CalendarOutbox.objects.bulk_create(to_create)
+        CalendarOutbox.objects.bulk_update(
+            to_update,
+            ['operation', 'google_event_id', 'attempts', 'next_attempt_at', 'last_error', 'updated_at']
+        )
+        if to_delete:
+            CalendarOutbox.objects.filter(pk__in=to_delete).delete()
+
+
+def enqueue_calendar_write(obj, operation):
+    """Queue a calendar write for one task or habit."""
+    enqueue_calendar_writes([obj], operation)
+
+
+def _build_request(service, entry, obj):
+    """Build, without executing, the Calendar API request for an outbox entry."""
+    events = service.events()
+    if entry.operation == 'delete':
+        return events.delete(calendarId='primary', eventId=entry.google_event_id)
+    if entry.operation == 'complete':
+        # Only the colour changes, so a patch is enough
+        return events.patch(
+            calendarId='primary',
+            eventId=obj.google_event_id,
+            body={'colorId': task_event_colour(obj)}
+        )
+
+    body = task_event_body(obj) if entry.kind == 'task' else habit_event_body(obj)
+    if obj.google_event_id:
+        return events.update(calendarId='primary', eventId=obj.google_event_id, body=body)
+    return events.insert(calendarId='primary', body=body)
+
+
+def _record_failure(entry, error, now):
+    entry.attempts += 1
+    delay = min(RETRY_BASE_DELAY * (2 ** (entry.attempts - 1)), RETRY_MAX_DELAY)
+    CalendarOutbox.objects.filter(pk=entry.pk, updated_at=entry.updated_at).update(
+        attempts=entry.attempts,
+        next_attempt_at=now + delay,
+        last_error=str(error)
+    )
+
+
+def _apply_user_entries(service, entries, now):
+    """Apply one user's outbox entries through Calendar API batch requests."""
+    objects = {
+        'task': Task.objects.in_bulk([e.object_id for e in entries if e.kind == 'task']),
+        'habit': Habit.objects.in_bulk([e.object_id for e in entries if e.kind == 'habit']),
+    }
+
+    requests = []
+    done = []
+    for entry in entries:
+        obj = objects[entry.kind].get(entry.object_id)
+        if entry.operation != 'delete' and obj is None:
+            # Deleted since; the delete entry takes care of the event
+            done.append(entry)
+            continue
+        requests.append((entry, obj, _build_request(service, entry, obj)))
+
+    results = {}
+
+    def collect(request_id, response, exception):
+        results[request_id] = (response, exception)
+
+    for start in range(0, len(requests), BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=collect)
+        for entry, obj, request in requests[start:start + BATCH_SIZE]:
+            batch.add(request, request_id=str(entry.pk))
+        batch.execute()
+
+    created = {'task': [], 'habit': []}
+    for entry, obj, request in requests:
+        response, exception = results.get(str(entry.pk), (None, RuntimeError("No batch response")))
+
+        if exception is not None:
+            # Deleting an event that is already gone counts as done
+            gone = isinstance(exception, HttpError) and exception.resp.status in (404, 410)
+            if not (entry.operation == 'delete' and gone):
+                logger.warning(f"Calendar write {entry} failed: {exception}")
+                _record_failure(entry, exception, now)
+                continue
+
+        if entry.operation == 'delete':
+            forget_calendar_event(entry.user_id, entry.google_event_id)
+        elif entry.operation == 'upsert':
+            if entry.kind == 'task':
+                mirror_calendar_event(entry.user_id, response)
+            else:
+                mark_calendar_stale(entry.user_id)
+            if response['id'] != obj.google_event_id:
+                obj.google_event_id = response['id']
+                created[entry.kind].append(obj)
+        done.append(entry)
+
+    for kind, model in (('task', Task), ('habit', Habit)):
+        if not created[kind]:
+            continue
+        model.objects.bulk_update(created[kind], ['google_event_id'])
+
+        # Remove events whose object was deleted while we were creating them
+        remaining = set(model.objects.filter(
+            pk__in=[obj.pk for obj in created[kind]]
+        ).values_list('pk', flat=True))
+        for obj in created[kind]:
+            if obj.pk not in remaining:
+                delete_calendar_event(service, obj)
+
+    # Leave entries alone if a newer write was coalesced into them meanwhile
+    for entry in done:
+        CalendarOutbox.objects.filter(pk=entry.pk, updated_at=entry.updated_at).delete()
+
+
+def process_calendar_outbox(limit=100):
+    """Apply due outbox entries, batched per user. Returns the number of entries processed."""
+    now = timezone.now()
+    entries = list(CalendarOutbox.objects.filter(
+        next_attempt_at__lte=now,
+        attempts__lt=MAX_ATTEMPTS
+    ).select_related('user').order_by('next_attempt_at')[:limit])
+
+    by_user = {}
+    for entry in entries:
+        by_user.setdefault(entry.user_id, []).append(entry)
+
+    for user_entries in by_user.values():
+        try:
+            service = get_calendar_service(user_entries[0].user)
+            _apply_user_entries(service, user_entries, now)
+        except Exception as e:
+            logger.warning(f"Calendar writes for user {user_entries[0].user_id} failed: {e}")
+            for entry in user_entries:
+                _record_failure(entry, e, now)
+
+    return len(entries)
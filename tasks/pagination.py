@@ -0,0 +1,48 @@
+"""Keyset (cursor) pagination for newest-first lists.
+
+Pages are fetched with a WHERE on (created_at, id) instead of OFFSET, so
+every page costs the same index range scan no matter how deep the user
+scrolls.
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+PAGE_SIZE = 25
+
+
+def encode_cursor(obj):
+    """Encode the position just after obj as an opaque cursor string."""
+    raw = f"{obj.created_at.isoformat()}|{obj.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Decode a cursor into (created_at, pk). Raises ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except ValueError as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def keyset_page(queryset, cursor=None, page_size=PAGE_SIZE):
+    """Return (items, next_cursor) for a queryset listed newest first.
+
+    next_cursor is None on the last page.
+    """
+    queryset = queryset.order_by('-created_at', '-id')
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+        )
+
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        next_cursor = encode_cursor(items[-1])
+    return items, next_cursor
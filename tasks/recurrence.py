@@ -0,0 +1,59 @@
+"""Habit recurrence expansion.
+
+Occurrence dates are generated arithmetically from a habit's frequency and
+start date, so expanding a range costs time proportional to the number of
+occurrences produced rather than the number of days in the range.
+"""
+from calendar import monthrange
+from datetime import timedelta
+
+
+def occurrence_dates(frequency, anchor, start, end):
+    """Return the dates in [start, end) for a schedule starting on the anchor date.
+
+    Daily schedules occur every day, weekly ones on the anchor's weekday and
+    monthly ones on the anchor's day of the month (skipping months that are
+    too short). Nothing occurs before the anchor date.
+    """
+    first = max(start, anchor)
+    if first >= end:
+        return []
+
+    if frequency == 'daily':
+        return [first + timedelta(days=offset) for offset in range((end - first).days)]
+
+    if frequency == 'weekly':
+        first += timedelta(days=(anchor.weekday() - first.weekday()) % 7)
+        return [first + timedelta(days=offset) for offset in range(0, (end - first).days, 7)]
+
+    if frequency == 'monthly':
+        dates = []
+        year, month = first.year, first.month
+        while True:
+            if anchor.day <= monthrange(year, month)[1]:
+                day = first.replace(year=year, month=month, day=anchor.day)
+                if day >= end:
+                    break
+                if day >= first:
+                    dates.append(day)
+            elif (year, month) > (end.year, end.month):
+                break
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return dates
+
+    return []
+
+
+def expand_habits(habits, start, end):
+    """Return (habit, date) pairs for every occurrence of the habits in [start, end).
+
+    Habits sharing a frequency and start date share one expansion.
+    """
+    expansions = {}
+    occurrences = []
+    for habit in habits:
+        key = (habit.frequency, habit.start_date.date())
+        if key not in expansions:
+            expansions[key] = occurrence_dates(habit.frequency, key[1], start, end)
+        occurrences.extend((habit, day) for day in expansions[key])
+    return occurrences
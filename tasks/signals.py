@@ -0,0 +1,57 @@
+"""Signal handlers that keep each user's ScheduleVersion current.
+
+Any save or delete of a task, habit or habit completion bumps the owner's
+change counter, which also retires their cached calendar months and chatbot
+digest. Completions removed by a habit's cascade delete are skipped; the
+habit's own handler covers them with one bump.
+
+Code that writes through bulk_update() or update() bypasses these signals
+and must call bump_schedule_version() itself.
+"""
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Task, Habit, HabitCompletion, ScheduleVersion
+
+
+def bump_schedule_version(user_id):
+    """Record that the user's tasks, habits or completions changed."""
+    now = timezone.now()
+    updated = ScheduleVersion.objects.filter(user_id=user_id).update(
+        version=F('version') + 1,
+        updated_at=now
+    )
+    if not updated:
+        ScheduleVersion.objects.get_or_create(
+            user_id=user_id,
+            defaults={'version': 1, 'updated_at': now}
+        )
+
+
+@receiver([post_save, post_delete], sender=Task)
+def task_changed(sender, instance, **kwargs):
+    bump_schedule_version(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Habit)
+def habit_changed(sender, instance, **kwargs):
+    bump_schedule_version(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=HabitCompletion)
+def completion_changed(sender, instance, **kwargs):
+    # origin is the habit (or habit queryset) when this is part of its cascade
+    origin = kwargs.get('origin')
+    if isinstance(origin, Habit) or getattr(origin, 'model', None) is Habit:
+        return
+    
+    # Only look up the owner when the habit isn't loaded already
+    if HabitCompletion.habit.is_cached(instance):
+        user_id = instance.habit.user_id
+    else:
+        user_id = Habit.objects.filter(pk=instance.habit_id).values_list('user_id', flat=True).first()
+        if user_id is None:
+            return
+    bump_schedule_version(user_id)
@@ -0,0 +1,51 @@
+"""Coalescing of concurrent identical calls.
+
+When several threads ask for the same key at once, only the first runs the
+call; the others wait for its result (or exception) instead of repeating it.
+"""
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time within this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def claim(self, key):
+        """Return (future, leader) for a key.
+
+        The leader does the work and must hand its outcome to resolve();
+        other callers wait on future.result().
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def resolve(self, key, result=None, exception=None):
+        """Pass the leader's result or exception to the waiting callers and free the key."""
+        with self._lock:
+            future = self._calls.pop(key)
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def run(self, key, func):
+        """Return func(), sharing the result with concurrent callers using the same key."""
+        future, leader = self.claim(key)
+        if not leader:
+            return future.result()
+
+        try:
+            result = func()
+        except BaseException as e:
+            self.resolve(key, exception=e)
+            raise
+        self.resolve(key, result)
+        return result
@@ -0,0 +1,394 @@
+import json
+import threading
+from datetime import datetime, time, timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from . import digest
+from .chatbot import ChatbotHandler
+from .fakes import FakeCalendarService, FakeGenerativeModel
+from .forms import TaskFilterForm, TaskForm
+from .models import Task, Habit, HabitCompletion, CalendarEvent
+from .signals import bump_schedule_version
+from .utils import schedule_task, sync_calendar_events
+
+
+class CalendarDataQueryCountTests(TestCase):
+    """calendar_data costs the same number of queries however many habits a user has."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='calendar', password='secret')
+        self.client.force_login(self.user)
+        self.start = timezone.make_aware(datetime(2026, 10, 1))
+
+        for day in range(0, 28, 3):
+            Task.objects.create(
+                user=self.user,
+                title=f'Task {day}',
+                duration=30,
+                deadline=self.start + timedelta(days=day + 2),
+                scheduled_time=self.start + timedelta(days=day, hours=10)
+            )
+
+    def add_habits(self, count):
+        for number in range(count):
+            habit = Habit.objects.create(
+                user=self.user,
+                title=f'Habit {number}',
+                frequency=('daily', 'weekly', 'monthly')[number % 3],
+                duration=15,
+                start_date=self.start - timedelta(days=number),
+                preferred_time=time(7 + number % 10)
+            )
+            HabitCompletion.objects.bulk_create([
+                HabitCompletion(habit=habit, completed_date=self.start.date() + timedelta(days=day), completed=True)
+                for day in range(0, 31, 2)
+            ])
+
+    def get_month(self):
+        return self.client.get(reverse('tasks:calendar_data'), {'year': 2026, 'month': 10})
+
+    def test_query_count_does_not_grow_with_habits(self):
+        # Session, user, schedule version, then one query each for tasks, habits and completions
+        self.add_habits(2)
+        with self.assertNumQueries(6):
+            response = self.get_month()
+        self.assertEqual(response.status_code, 200)
+        few = len(response.json()['events'])
+
+        cache.clear()
+        self.add_habits(20)
+        with self.assertNumQueries(6):
+            response = self.get_month()
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(len(response.json()['events']), few)
+
+    def test_cached_month_skips_the_event_queries(self):
+        self.add_habits(5)
+        self.get_month()
+        with self.assertNumQueries(3):
+            response = self.get_month()
+        self.assertEqual(response.status_code, 200)
+
+
+class IndexUsageTests(TestCase):
+    """The hot Task, Habit and HabitCompletion queries are answered from their indexes."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='indexes', password='secret')
+        self.now = timezone.now()
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, f"Expected {index_name} in the query plan:\n{plan}")
+
+    def test_open_tasks_by_deadline(self):
+        # home and the chatbot's due-date questions
+        tasks = Task.objects.filter(
+            user=self.user,
+            deadline__gte=self.now,
+            deadline__lte=self.now + timedelta(days=7),
+            completed=False
+        ).order_by('deadline')
+        self.assertUsesIndex(tasks, 'task_user_open_deadline_idx')
+
+    def test_tasks_by_scheduled_time(self):
+        # calendar_data and the range API
+        tasks = Task.objects.filter(
+            user=self.user,
+            scheduled_time__gte=self.now,
+            scheduled_time__lt=self.now + timedelta(days=31)
+        ).values_list('id', 'title', 'scheduled_time')
+        self.assertUsesIndex(tasks, 'task_user_scheduled_idx')
+
+    def test_task_list_newest_first(self):
+        tasks = Task.objects.filter(user=self.user).order_by('-created_at', '-id')[:26]
+        self.assertUsesIndex(tasks, 'task_user_created_idx')
+
+    def test_task_list_filtered_by_status(self):
+        filter_form = TaskFilterForm({'completed': 'true'})
+        tasks = filter_form.filter(Task.objects.filter(user=self.user)).order_by('-created_at', '-id')[:26]
+        self.assertUsesIndex(tasks, 'task_user_status_created_idx')
+
+    def test_habit_list_newest_first(self):
+        habits = Habit.objects.filter(user=self.user).order_by('-created_at', '-id')[:26]
+        self.assertUsesIndex(habits, 'habit_user_created_idx')
+
+    def test_habit_completions_by_date(self):
+        # habit_detail; served by the unique_together index on (habit, completed_date)
+        today = self.now.date()
+        completions = HabitCompletion.objects.filter(
+            habit_id=1,
+            completed_date__gte=today - timedelta(days=30),
+            completed_date__lte=today
+        ).order_by('completed_date')
+        self.assertUsesIndex(completions, 'habit_id_completed_date')
+
+
+class CalendarSyncTests(TestCase):
+    """The local calendar mirror follows Google through sync tokens, driven by FakeCalendarService."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='sync', password='secret')
+        self.start = timezone.now().replace(microsecond=0) + timedelta(days=1)
+        self.service = FakeCalendarService(
+            [self.event(f'event{number}', hours=number) for number in range(5)],
+            page_size=2
+        )
+
+    def event(self, event_id, hours, summary='Meeting'):
+        start = self.start + timedelta(hours=hours)
+        return {
+            'id': event_id,
+            'summary': summary,
+            'start': {'dateTime': start.isoformat()},
+            'end': {'dateTime': (start + timedelta(minutes=30)).isoformat()},
+        }
+
+    def sync(self):
+        return sync_calendar_events(self.user, service=self.service, force=True)
+
+    def mirrored(self):
+        return dict(CalendarEvent.objects.filter(user=self.user).values_list('google_event_id', 'summary'))
+
+    def list_calls(self):
+        return [params for method, params in self.service.calls if method == 'list']
+
+    def test_full_sync_follows_every_page(self):
+        state = self.sync()
+        self.assertEqual(set(self.mirrored()), {f'event{number}' for number in range(5)})
+        self.assertEqual(len(self.list_calls()), 3)
+        self.assertNotIn('syncToken', self.list_calls()[0])
+        self.assertTrue(state.sync_token)
+
+    def test_incremental_sync_applies_only_the_changes(self):
+        self.sync()
+        self.service.calls.clear()
+
+        events = self.service.events()
+        events.insert(calendarId='primary', body=self.event('added', hours=8)).execute()
+        events.patch(calendarId='primary', eventId='event1', body={'summary': 'Moved'}).execute()
+        events.delete(calendarId='primary', eventId='event2').execute()
+        self.sync()
+
+        calls = self.list_calls()
+        self.assertEqual(len(calls), 2)
+        self.assertIn('syncToken', calls[0])
+        self.assertNotIn('timeMin', calls[0])
+        mirrored = self.mirrored()
+        self.assertEqual(mirrored['event1'], 'Moved')
+        self.assertIn('added', mirrored)
+        self.assertNotIn('event2', mirrored)
+        self.assertEqual(len(mirrored), 5)
+
+    def test_expired_sync_token_triggers_a_full_sync(self):
+        self.sync()
+        self.service.events().delete(calendarId='primary', eventId='event0').execute()
+        self.service.expire_sync_tokens()
+        self.service.calls.clear()
+
+        state = self.sync()
+        calls = self.list_calls()
+        self.assertIn('syncToken', calls[0])
+        self.assertNotIn('syncToken', calls[1])
+        self.assertEqual(set(self.mirrored()), {f'event{number}' for number in range(1, 5)})
+        self.assertTrue(state.sync_token)
+
+
+class ChatbotStreamTests(TestCase):
+    """General questions stream from the model, driven by FakeGenerativeModel."""
+
+    def setUp(self):
+        cache.clear()
+        caches['chatbot'].clear()
+        self.user = User.objects.create_user(username='chat', password='secret')
+        self.model = FakeGenerativeModel(reply='Habits repeat daily, weekly or monthly.', chunk_size=10, delay=0.05)
+        self.handler = ChatbotHandler(model=self.model)
+
+    def read_events(self, response):
+        """Return (event, data) pairs from a server-sent event stream."""
+        events = []
+        for frame in b''.join(response.streaming_content).decode().split('\n\n'):
+            if not frame:
+                continue
+            event = 'message'
+            for line in frame.split('\n'):
+                if line.startswith('event: '):
+                    event = line[len('event: '):]
+                elif line.startswith('data: '):
+                    events.append((event, json.loads(line[len('data: '):])))
+        return events
+
+    def test_stream_endpoint_sends_chunks_then_done(self):
+        self.client.force_login(self.user)
+        with mock.patch('tasks.chatbot._handler', self.handler):
+            response = self.client.post(reverse('tasks:chatbot_stream'), {'message': 'How do habits work?'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = self.read_events(response)
+        chunks = [data['message'] for event, data in events[:-1]]
+        self.assertEqual(chunks, ['Habits rep', 'eat daily,', ' weekly or', ' monthly.'])
+        self.assertTrue(all(event == 'message' for event, data in events[:-1]))
+        self.assertEqual(events[-1], ('done', {}))
+
+    def test_stream_endpoint_rejects_malformed_json(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('tasks:chatbot_stream'), '{not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_identical_concurrent_questions_share_one_model_call(self):
+        replies = []
+
+        def ask():
+            replies.append(''.join(
+                response['message'] for response in self.handler.stream_message('How do habits work?', self.user)
+            ))
+
+        threads = [threading.Thread(target=ask) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.model.prompts), 1)
+        self.assertEqual(replies, [self.model.reply] * 5)
+
+        # Later askers are answered from the cache in one chunk
+        self.assertEqual(list(self.handler.stream_message('how do habits work', self.user)), [{'message': self.model.reply}])
+        self.assertEqual(len(self.model.prompts), 1)
+
+
+class ChatbotIntentTests(TestCase):
+    """Commands answered by the chatbot's fast path, without the model."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='intents', password='secret')
+        self.model = FakeGenerativeModel()
+        self.handler = ChatbotHandler(model=self.model)
+        self.deadline = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=14), time(17)))
+
+    def test_move_unscheduled_task_keeps_its_deadline(self):
+        task = Task.objects.create(user=self.user, title='Write report', duration=60, deadline=self.deadline)
+
+        response = self.handler.process_message('move write report to tomorrow 3pm', self.user)
+
+        task.refresh_from_db()
+        expected = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), time(15)))
+        self.assertEqual(task.scheduled_time, expected)
+        self.assertEqual(task.deadline, self.deadline)
+        self.assertIn('Moved', response['message'])
+        self.assertEqual(self.model.prompts, [])
+
+    def test_move_scheduled_task_shifts_its_deadline(self):
+        scheduled = self.deadline - timedelta(days=2)
+        task = Task.objects.create(
+            user=self.user, title='Write report', duration=60, deadline=self.deadline, scheduled_time=scheduled
+        )
+
+        self.handler.process_message('move write report to tomorrow 3pm', self.user)
+
+        task.refresh_from_db()
+        self.assertEqual(task.deadline - task.scheduled_time, self.deadline - scheduled)
+
+
+class DigestTests(TestCase):
+    """The chatbot digest follows the schedule version, whichever process changed it."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='digest', password='secret')
+        self.deadline = timezone.now() + timedelta(days=3)
+        self.task = Task.objects.create(user=self.user, title='Plan trip', duration=30, deadline=self.deadline)
+
+    def test_bulk_change_is_seen_after_a_version_bump(self):
+        self.assertEqual(digest.get_digest(self.user.id)['tasks'][self.task.pk][1], self.deadline)
+
+        # As schedule_tasks or the bulk move endpoint would, from any process
+        moved = self.deadline + timedelta(days=5)
+        Task.objects.filter(pk=self.task.pk).update(deadline=moved)
+        bump_schedule_version(self.user.id)
+
+        self.assertEqual(digest.get_digest(self.user.id)['tasks'][self.task.pk][1], moved)
+
+    def test_unchanged_schedule_is_served_from_the_cache(self):
+        digest.get_digest(self.user.id)
+        with self.assertNumQueries(1):
+            digest.get_digest(self.user.id)
+
+
+class ScheduleTaskTests(TestCase):
+    """schedule_task plans around the user's own tasks when there is no Google account."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='planner', password='secret')
+        self.deadline = timezone.now() + timedelta(days=7)
+
+    def test_without_google_places_task_in_a_free_gap(self):
+        first = schedule_task(self.user, 60, self.deadline, 1)
+        self.assertNotEqual(first, self.deadline - timedelta(minutes=60))
+        Task.objects.create(user=self.user, title='Blocker', duration=60, deadline=self.deadline, scheduled_time=first)
+
+        second = schedule_task(self.user, 60, self.deadline, 1)
+        self.assertGreaterEqual(second, first + timedelta(minutes=60))
+        self.assertLess(second, self.deadline - timedelta(minutes=60))
+
+    def test_rescheduled_task_does_not_block_itself(self):
+        first = schedule_task(self.user, 60, self.deadline, 1)
+        task = Task.objects.create(user=self.user, title='Move me', duration=60, deadline=self.deadline, scheduled_time=first)
+
+        self.assertEqual(schedule_task(self.user, 60, self.deadline, 1, exclude_task=task), first)
+
+
+class TaskFormSlotTests(TestCase):
+    """A slot picked from the suggestions is checked again when the form is submitted."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='slots', password='secret')
+        self.slot = (timezone.now() + timedelta(days=1)).replace(microsecond=0)
+        self.deadline = self.slot + timedelta(days=2)
+        self.blocker = Task.objects.create(
+            user=self.user, title='Blocker', duration=60, deadline=self.deadline, scheduled_time=self.slot
+        )
+
+    def form(self, slot, instance=None):
+        return TaskForm({
+            'title': 'Write report',
+            'duration': 60,
+            'deadline': self.deadline,
+            'priority': 2,
+            'scheduled_slot': slot,
+        }, instance=instance, user=self.user)
+
+    def test_rejects_a_slot_in_the_past(self):
+        form = self.form(timezone.now() - timedelta(hours=1))
+        self.assertFalse(form.is_valid())
+        self.assertIn('already started', str(form.non_field_errors()))
+
+    def test_rejects_a_slot_overlapping_another_task(self):
+        form = self.form(self.slot + timedelta(minutes=30))
+        self.assertFalse(form.is_valid())
+        self.assertIn('no longer free', str(form.non_field_errors()))
+
+    def test_accepts_a_free_slot(self):
+        self.assertTrue(self.form(self.slot + timedelta(minutes=60)).is_valid())
+
+    def test_edited_task_does_not_overlap_itself(self):
+        self.assertTrue(self.form(self.slot + timedelta(minutes=30), instance=self.blocker).is_valid())
+
+    def test_suggestions_never_start_in_the_past(self):
+        self.client.force_login(self.user)
+        now = timezone.now()
+        response = self.client.get(reverse('tasks:suggest_task_slots'), {
+            'duration': 30, 'deadline': self.deadline.strftime('%Y-%m-%dT%H:%M'), 'priority': 1, 'k': 10
+        })
+        self.assertEqual(response.status_code, 200)
+        for slot in response.json()['slots']:
+            self.assertGreaterEqual(datetime.fromisoformat(slot['start']), now - timedelta(seconds=1))
@@ -27,8 +27,15 @@ urlpatterns = [
     # Calendar URLs
     path('calendar/', views.calendar_view, name='calendar'),
     path('api/calendar-data/', views.calendar_data, name='calendar_data'),
+    path('api/calendar-range/', views.calendar_range_data, name='calendar_range_data'),
     path('api/update-task-schedule/', views.update_task_schedule, name='update_task_schedule'),
+    path('api/bulk-update-task-schedule/', views.bulk_update_task_schedule, name='bulk_update_task_schedule'),
+    path('api/tasks/', views.task_list_data, name='task_list_data'),
+    path('api/habits/', views.habit_list_data, name='habit_list_data'),
+    path('api/suggest-slots/', views.suggest_task_slots, name='suggest_task_slots'),
     path('chatbot/', views.chatbot_view, name='chatbot'),
+    path('chatbot/stream/', views.chatbot_stream, name='chatbot_stream'),
+    path('chatbot/stats/', views.chatbot_stats, name='chatbot_stats'),
     
 
 ]
\ No newline at end of file
@@ -1,23 +1,99 @@
+from google.auth.exceptions import GoogleAuthError
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
 from allauth.socialaccount.models import SocialToken, SocialApp
+from django.conf import settings
+from django.db.models import Q
 from django.utils import timezone
 from datetime import datetime, timedelta
+import heapq
+import json
+import threading
+from .freebusy import BusyIndex, free_gaps
+from .models import Task, CalendarEvent, CalendarSyncState
+
+# Define working hours (9 AM to 6 PM)
+WORKING_START_HOUR = 9
+WORKING_END_HOUR = 18
+
+# Weights of the slot score components; they add up to 1
+PROXIMITY_WEIGHT = 0.6
+FRAGMENTATION_WEIGHT = 0.25
+CONTEXT_SWITCH_WEIGHT = 0.15
+
+# Free time shorter than this left beside a slot is too short to use
+MIN_USEFUL_GAP = timedelta(minutes=30)
+
+# Errors meaning the user's Google Calendar can't be read: no connected
+# account or app, a revoked or expired token, or an API error
+CALENDAR_ERRORS = (SocialToken.DoesNotExist, SocialApp.DoesNotExist, GoogleAuthError, HttpError)
+
+# Parsed Calendar discovery document, shared by every service we build
+_calendar_discovery_document = None
+
+# SocialApp credentials for Google, loaded once per process
+_google_app_credentials = None
+
+# Built services per thread, keyed by user id; httplib2 connections are not
+# safe to share between threads
+_service_pool = threading.local()
+_service_pool_lock = threading.Lock()
+
+# Bumped by clear_calendar_service_pool(); each thread drops its pool when it sees a new value
+_service_pool_generation = 0
 
 def get_calendar_service(user):
-    """Get a Google Calendar API service instance for the given user."""
-    social_token = SocialToken.objects.get(account__user=user, account__provider='google')
-    social_app = SocialApp.objects.get(provider='google')
+    """Get a Google Calendar API service instance for the given user.
+    
+    Services are pooled per thread and user and reused until the user's
+    stored OAuth token changes, so repeat calls cost one small token query
+    instead of credential setup and a discovery document parse.
+    """
+    global _calendar_discovery_document, _google_app_credentials
+    
+    token, refresh_token = SocialToken.objects.filter(
+        account__user=user,
+        account__provider='google'
+    ).values_list('token', 'token_secret').get()
     
+    services = getattr(_service_pool, 'services', None)
+    if services is None or _service_pool.generation != _service_pool_generation:
+        services = _service_pool.services = {}
+        _service_pool.generation = _service_pool_generation
+    
+    pooled = services.get(user.pk)
+    if pooled is not None and pooled[0] == (token, refresh_token):
+        return pooled[1]
+    
+    with _service_pool_lock:
+        if _google_app_credentials is None:
+            _google_app_credentials = SocialApp.objects.filter(
+                provider='google'
+            ).values_list('client_id', 'secret').get()
+        if _calendar_discovery_document is None:
+            _calendar_discovery_document = json.loads(get_static_doc('calendar', 'v3'))
+    
+    client_id, client_secret = _google_app_credentials
     credentials = Credentials(
-        token=social_token.token,
-        refresh_token=social_token.token_secret,
+        token=token,
+        refresh_token=refresh_token,
         token_uri='https://oauth2.googleapis.com/token',
-        client_id=social_app.client_id,
-        client_secret=social_app.secret
+        client_id=client_id,
+        client_secret=client_secret
     )
     
-    return build('calendar', 'v3', credentials=credentials)
+    service = build_from_document(_calendar_discovery_document, credentials=credentials)
+    services[user.pk] = ((token, refresh_token), service)
+    return service
+
+def clear_calendar_service_pool():
+    """Forget pooled services in every thread and the cached app credentials, e.g. after rotating the OAuth client."""
+    global _google_app_credentials, _service_pool_generation
+    with _service_pool_lock:
+        _google_app_credentials = None
+        _service_pool_generation += 1
 
 def get_calendar_events(service, time_min=None, time_max=None):
     """Fetch events from Google Calendar within the specified time range."""
@@ -40,38 +116,195 @@ def get_calendar_events(service, time_min=None, time_max=None):
     
     return events_result.get('items', [])
 
-def find_available_slot(service, duration_minutes, deadline, priority, existing_events=None):
-    """Find an available time slot for a task before the deadline using AI scheduling."""
-    # If no existing events provided, fetch them
-    if existing_events is None:
-        # Fetch events from now until the deadline
-        existing_events = get_calendar_events(
-            service, 
-            time_min=timezone.now(),
-            time_max=deadline
-        )
+def get_event_bounds(event):
+    """Return the (start, end) datetimes of a Google Calendar event."""
+    if 'dateTime' in event['start'] and 'dateTime' in event['end']:
+        start = datetime.fromisoformat(event['start']['dateTime'].replace('Z', '+00:00'))
+        end = datetime.fromisoformat(event['end']['dateTime'].replace('Z', '+00:00'))
+    else:
+        # All-day events only carry a date
+        start = timezone.make_aware(datetime.fromisoformat(event['start']['date']))
+        end = timezone.make_aware(datetime.fromisoformat(event['end']['date']))
+    return start, end
+
+def sync_calendar_events(user, service=None, force=False):
+    """Bring the user's local CalendarEvent mirror up to date with Google.
     
-    # Convert duration to timedelta
-    duration = timedelta(minutes=duration_minutes)
+    The first sync lists every event from yesterday onwards; after that only
+    the changes since the stored sync token are fetched. Syncs are skipped
+    while the mirror is younger than CALENDAR_SYNC_INTERVAL seconds, unless
+    forced.
+    """
+    state, created = CalendarSyncState.objects.get_or_create(user=user)
+    now = timezone.now()
+    interval = timedelta(seconds=getattr(settings, 'CALENDAR_SYNC_INTERVAL', 300))
+    if not force and state.synced_at and now - state.synced_at < interval:
+        return state
     
-    # Start from current time
-    current_time = timezone.now()
+    if service is None:
+        service = get_calendar_service(user)
     
-    # Define working hours (9 AM to 6 PM)
-    working_start_hour = 9
-    working_end_hour = 18
+    try:
+        sync_token = _sync_event_pages(user, service, state.sync_token, now)
+    except HttpError as e:
+        # Google expires sync tokens; start over with a full sync
+        if not state.sync_token or e.resp.status != 410:
+            raise
+        sync_token = _sync_event_pages(user, service, None, now)
+    
+    state.sync_token = sync_token
+    state.synced_at = now
+    state.save()
+    return state
+
+def _sync_event_pages(user, service, sync_token, now):
+    """List every page of changes into the mirror and return the next sync token."""
+    params = {'calendarId': 'primary', 'singleEvents': True}
+    if sync_token:
+        params['syncToken'] = sync_token
+    else:
+        params['timeMin'] = (now - timedelta(days=1)).isoformat()
+    
+    full_sync = not sync_token
+    while True:
+        result = service.events().list(**params).execute()
+        
+        if full_sync:
+            # Only drop the old mirror once Google has accepted the request
+            CalendarEvent.objects.filter(user=user).delete()
+            full_sync = False
+        
+        # One upsert and one delete per page
+        cancelled = []
+        changed = []
+        for event in result.get('items', []):
+            if event.get('status') == 'cancelled':
+                cancelled.append(event['id'])
+            else:
+                changed.append(event)
+        mirror_calendar_events(user.id, changed)
+        if cancelled:
+            CalendarEvent.objects.filter(user=user, google_event_id__in=cancelled).delete()
+        
+        if 'nextPageToken' not in result:
+            return result.get('nextSyncToken')
+        params['pageToken'] = result['nextPageToken']
+
+def mirror_calendar_event(user_id, event):
+    """Store a Google Calendar event in the local mirror."""
+    mirror_calendar_events(user_id, [event])
+
+def mirror_calendar_events(user_id, events):
+    """Insert or update Google Calendar events in the local mirror with one query."""
+    rows = {}
+    for event in events:
+        start, end = get_event_bounds(event)
+        # A later copy of the same event wins
+        rows[event['id']] = CalendarEvent(
+            user_id=user_id,
+            google_event_id=event['id'],
+            summary=event.get('summary', '')[:255],
+            start=start,
+            end=end,
+            all_day='dateTime' not in event['start']
+        )
+    if rows:
+        CalendarEvent.objects.bulk_create(
+            rows.values(),
+            update_conflicts=True,
+            unique_fields=['user', 'google_event_id'],
+            update_fields=['summary', 'start', 'end', 'all_day', 'updated_at']
+        )
+
+def mark_calendar_stale(user_id):
+    """Make the next read sync the user's calendar mirror with Google."""
+    CalendarSyncState.objects.filter(user_id=user_id).update(synced_at=None)
+
+def get_mirrored_busy_periods(user, time_min, time_max, exclude_event_ids=()):
+    """Return (start, end) busy periods for a user from the local calendar mirror."""
+    sync_calendar_events(user)
+    return list(CalendarEvent.objects.filter(
+        user=user,
+        all_day=False,
+        start__lt=time_max,
+        end__gt=time_min
+    ).exclude(
+        google_event_id__in=exclude_event_ids
+    ).values_list('start', 'end'))
+
+def get_task_busy_periods(user, time_min, time_max, exclude_task=None):
+    """Return (start, end) busy periods for the user's open, scheduled tasks."""
+    tasks = Task.objects.filter(
+        user=user,
+        completed=False,
+        # Tasks run for less than a day, so only a day back can still overlap
+        scheduled_time__gte=time_min - timedelta(days=1),
+        scheduled_time__lt=time_max
+    )
+    if exclude_task is not None:
+        tasks = tasks.exclude(pk=exclude_task.pk)
     
-    # Create a list of busy periods
     busy_periods = []
-    for event in existing_events:
+    for start, duration in tasks.values_list('scheduled_time', 'duration'):
+        end = start + timedelta(minutes=duration)
+        if end > time_min:
+            busy_periods.append((start, end))
+    return busy_periods
+
+def get_user_busy_periods(user, time_min, time_max, exclude_task=None):
+    """Return the user's busy periods: their scheduled tasks, plus their Google Calendar when it can be read.
+    
+    exclude_task leaves out a task being rescheduled, and its calendar event.
+    """
+    busy_periods = get_task_busy_periods(user, time_min, time_max, exclude_task)
+    exclude_event_ids = [exclude_task.google_event_id] if exclude_task is not None and exclude_task.google_event_id else []
+    try:
+        busy_periods += get_mirrored_busy_periods(user, time_min, time_max, exclude_event_ids)
+    except CALENDAR_ERRORS:
+        # No usable Google account; plan around the tasks alone
+        pass
+    return busy_periods
+
+def get_busy_periods(events):
+    """Convert Google Calendar events into (start, end) busy periods."""
+    busy_periods = []
+    for event in events:
         if 'dateTime' in event['start'] and 'dateTime' in event['end']:
             start = datetime.fromisoformat(event['start']['dateTime'].replace('Z', '+00:00'))
             end = datetime.fromisoformat(event['end']['dateTime'].replace('Z', '+00:00'))
             busy_periods.append((start, end))
+    return busy_periods
+
+def find_available_slot(service, duration_minutes, deadline, priority, existing_events=None, busy_periods=None):
+    """Find an available time slot for a task before the deadline using AI scheduling."""
+    # If no busy periods provided, read them from the existing events
+    if busy_periods is None:
+        # If no existing events provided, fetch them
+        if existing_events is None:
+            # Fetch events from now until the deadline
+            existing_events = get_calendar_events(
+                service, 
+                time_min=timezone.now(),
+                time_max=deadline
+            )
+        busy_periods = get_busy_periods(existing_events)
     
-    # Sort busy periods by start time
-    busy_periods.sort(key=lambda x: x[0])
+    # Convert duration to timedelta
+    duration = timedelta(minutes=duration_minutes)
     
+    # Start from current time
+    current_time = timezone.now()
+    
+    # Build the free/busy index once and sweep it into the free working-hour
+    # gaps between now and the deadline; every strategy selects from this list
+    busy = BusyIndex(busy_periods)
+    gaps = free_gaps(busy, current_time, deadline, WORKING_START_HOUR, WORKING_END_HOUR)
+    
+    scheduling_strategy = get_scheduling_strategy(priority, current_time, deadline)
+    return select_slot(scheduling_strategy, current_time, duration, deadline, gaps)
+
+def get_scheduling_strategy(priority, current_time, deadline):
+    """Pick the scheduling strategy for a task based on priority and deadline."""
     # Calculate time until deadline
     time_until_deadline = deadline - current_time
     days_until_deadline = time_until_deadline.days + (time_until_deadline.seconds / 86400)
@@ -79,285 +312,230 @@ def find_available_slot(service, duration_minutes, deadline, priority, existing_
     # Determine scheduling strategy based on priority and deadline
     if priority == 1:  # High priority
         # For high priority tasks, schedule as soon as possible
-        scheduling_strategy = "asap"
+        return "asap"
     elif priority == 2:  # Medium priority
         if days_until_deadline < 2:  # If deadline is close, schedule soon
-            scheduling_strategy = "asap"
+            return "asap"
         else:  # Otherwise, distribute evenly
-            scheduling_strategy = "distributed"
+            return "distributed"
     else:  # Low priority
         if days_until_deadline < 1:  # If deadline is very close, schedule soon
-            scheduling_strategy = "asap"
+            return "asap"
         else:  # Otherwise, schedule closer to deadline
-            scheduling_strategy = "deadline"
-    
-    # Find available slots based on strategy
+            return "deadline"
+
+def select_slot(scheduling_strategy, current_time, duration, deadline, gaps):
+    """Pick a slot from the free gaps using the given strategy."""
     if scheduling_strategy == "asap":
         # Find the earliest available slot
-        return find_earliest_slot(current_time, duration, deadline, busy_periods, working_start_hour, working_end_hour)
+        return find_earliest_slot(current_time, duration, deadline, gaps)
     elif scheduling_strategy == "deadline":
         # Find a slot closer to the deadline
-        return find_deadline_slot(current_time, duration, deadline, busy_periods, working_start_hour, working_end_hour)
+        return find_deadline_slot(current_time, duration, deadline, gaps)
     else:  # distributed
         # Find a slot distributed between now and deadline
-        return find_distributed_slot(current_time, duration, deadline, busy_periods, working_start_hour, working_end_hour)
+        return find_distributed_slot(current_time, duration, deadline, gaps)
 
-def find_earliest_slot(current_time, duration, deadline, busy_periods, working_start_hour, working_end_hour):
+def find_earliest_slot(current_time, duration, deadline, gaps):
     """Find the earliest available time slot."""
-    while current_time + duration <= deadline:
-        # Move to the next day if we're past working hours
-        if current_time.hour >= working_end_hour:
-            current_time = current_time.replace(
-                hour=working_start_hour, 
-                minute=0, 
-                second=0, 
-                microsecond=0
-            ) + timedelta(days=1)
-            continue
-        
-        # If before working hours, move to working start time
-        if current_time.hour < working_start_hour:
-            current_time = current_time.replace(
-                hour=working_start_hour, 
-                minute=0, 
-                second=0, 
-                microsecond=0
-            )
-        
-        # Check if current_time falls on a weekend (5=Saturday, 6=Sunday)
-        if current_time.weekday() >= 5:  # Weekend
-            current_time = current_time.replace(
-                hour=working_start_hour, 
-                minute=0, 
-                second=0, 
-                microsecond=0
-            ) + timedelta(days=1)
-            # Skip to Monday if it's Saturday
-            if current_time.weekday() == 5:
-                current_time += timedelta(days=2)
-            # Skip to Monday if it's Sunday
-            elif current_time.weekday() == 6:
-                current_time += timedelta(days=1)
-            continue
-        
-        # Potential end time
-        potential_end_time = current_time + duration
-        
-        # Check if this slot conflicts with any busy period
-        conflict = False
-        for busy_start, busy_end in busy_periods:
-            # Check for overlap
-            if (current_time < busy_end and potential_end_time > busy_start):
-                conflict = True
-                # Move current_time to the end of this busy period
-                current_time = busy_end
-                break
-        
-        # If no conflict, we found an available slot
-        if not conflict:
-            return current_time
-        
+    for gap_start, gap_end in gaps:
+        if gap_end - gap_start >= duration:
+            return gap_start
+    
     # If we couldn't find a slot before the deadline, return the deadline minus duration
     return deadline - duration
 
-def find_deadline_slot(current_time, duration, deadline, busy_periods, working_start_hour, working_end_hour):
+def find_deadline_slot(current_time, duration, deadline, gaps):
     """Find a time slot closer to the deadline."""
-    # Start from deadline and work backwards
-    current_time = deadline - duration
-    
-    while current_time >= timezone.now():
-        # Check if current_time is within working hours
-        if current_time.hour < working_start_hour or current_time.hour >= working_end_hour:
-            # Move to the previous day's end of working hours
-            current_time = current_time.replace(
-                hour=working_end_hour - 1, 
-                minute=0, 
-                second=0, 
-                microsecond=0
-            )
-            if current_time + duration > deadline:
-                current_time = current_time - timedelta(days=1)
-            continue
-        
-        # Check if current_time falls on a weekend (5=Saturday, 6=Sunday)
-        if current_time.weekday() >= 5:  # Weekend
-            # Move to Friday
-            days_to_subtract = 1 if current_time.weekday() == 6 else 2
-            current_time = current_time - timedelta(days=days_to_subtract)
-            current_time = current_time.replace(
-                hour=working_end_hour - 1, 
-                minute=0, 
-                second=0, 
-                microsecond=0
-            )
-            continue
-        
-        # Potential end time
-        potential_end_time = current_time + duration
-        
-        # Check if this slot conflicts with any busy period
-        conflict = False
-        for busy_start, busy_end in busy_periods:
-            # Check for overlap
-            if current_time < busy_end and potential_end_time > busy_start:
-                conflict = True
-                # Move current_time before the start of this busy period
-                current_time = busy_start - duration
-                break
-        
-        # If no conflict, we found an available slot
-        if not conflict and potential_end_time <= deadline:
-            return current_time
-        
-        # Move back by 30 minutes if there was a conflict
-        if conflict:
-            continue
-        else:
-            current_time = current_time - timedelta(minutes=30)
+    # Take the latest gap that fits and finish the task at its end
+    for gap_start, gap_end in reversed(gaps):
+        if gap_end - gap_start >= duration:
+            return gap_end - duration
     
     # If we couldn't find a slot, fall back to earliest slot method
-    return find_earliest_slot(timezone.now(), duration, deadline, busy_periods, working_start_hour, working_end_hour)
+    return find_earliest_slot(current_time, duration, deadline, gaps)
 
-def find_distributed_slot(current_time, duration, deadline, busy_periods, working_start_hour, working_end_hour):
+def find_distributed_slot(current_time, duration, deadline, gaps):
     """Find a time slot distributed between now and the deadline."""
     # Calculate a target time approximately halfway between now and the deadline
     time_until_deadline = deadline - current_time
     target_time = current_time + (time_until_deadline / 2)
     
-    # Try to find a slot near the target time
-    # First try after the target time
-    search_time = target_time
-    while search_time + duration <= deadline:
-        # Ensure we're within working hours
-        if search_time.hour < working_start_hour:
-            search_time = search_time.replace(
-                hour=working_start_hour, 
-                minute=0, 
-                second=0, 
-                microsecond=0
-            )
-        elif search_time.hour >= working_end_hour:
-            search_time = search_time.replace(
-                hour=working_start_hour, 
-                minute=0, 
-                second=0, 
-                microsecond=0
-            ) + timedelta(days=1)
-            continue
-        
-        # Check if search_time falls on a weekend
-        if search_time.weekday() >= 5:  # Weekend
-            days_to_add = 8 - search_time.weekday()  # Move to next Monday
-            search_time = search_time.replace(
-                hour=working_start_hour, 
-                minute=0, 
-                second=0, 
-                microsecond=0
-            ) + timedelta(days=days_to_add)
-            continue
-        
-        # Potential end time
-        potential_end_time = search_time + duration
-        
-        # Check if this slot conflicts with any busy period
-        conflict = False
-        for busy_start, busy_end in busy_periods:
-            # Check for overlap
-            if search_time < busy_end and potential_end_time > busy_start:
-                conflict = True
-                # Move search_time to the end of this busy period
-                search_time = busy_end
-                break
-        
-        # If no conflict, we found an available slot
-        if not conflict:
-            return search_time
-        
-        # If we had a conflict, the loop will continue with the updated search_time
-    
-    # If we couldn't find a slot after the target time, try before it
-    search_time = target_time - duration
-    while search_time >= current_time:
-        # Ensure we're within working hours
-        if search_time.hour < working_start_hour or search_time.hour >= working_end_hour:
-            # Move to the previous day's end of working hours
-            search_time = search_time.replace(
-                hour=working_end_hour - 1, 
-                minute=0, 
-                second=0, 
-                microsecond=0
-            ) - timedelta(days=1)
+    # First try the earliest slot starting at or after the target time
+    for gap_start, gap_end in gaps:
+        slot_start = max(gap_start, target_time)
+        if gap_end - slot_start >= duration:
+            return slot_start
+    
+    # If we couldn't find a slot after the target time, take the latest one finishing before it
+    for gap_start, gap_end in reversed(gaps):
+        slot_end = min(gap_end, target_time)
+        if slot_end - gap_start >= duration:
+            return slot_end - duration
+    
+    # If we couldn't find a slot, fall back to earliest slot method
+    return find_earliest_slot(current_time, duration, deadline, gaps)
+
+def strategy_target(scheduling_strategy, current_time, duration, deadline):
+    """Return the start time a strategy would ideally pick."""
+    if scheduling_strategy == "asap":
+        return current_time
+    elif scheduling_strategy == "deadline":
+        return deadline - duration
+    else:  # distributed
+        return current_time + (deadline - current_time) / 2
+
+def score_slot(start, duration, gap_start, gap_end, target_time, span):
+    """Score a slot inside a free gap. Returns (score, proximity, fragments, context_switches).
+    
+    Proximity is 1 at the strategy's target time and falls off linearly over
+    the planning span. Fragments count leftover pieces of the gap too short
+    to use, and context switches count the sides on which the slot doesn't
+    butt up against the gap's edge.
+    """
+    before = start - gap_start
+    after = gap_end - (start + duration)
+    
+    proximity = max(0.0, 1 - abs(start - target_time) / span) if span else 1.0
+    fragments = sum(1 for piece in (before, after) if timedelta(0) < piece < MIN_USEFUL_GAP)
+    context_switches = sum(1 for piece in (before, after) if piece > timedelta(0))
+    
+    score = (
+        PROXIMITY_WEIGHT * proximity
+        + FRAGMENTATION_WEIGHT * (1 - fragments / 2)
+        + CONTEXT_SWITCH_WEIGHT * (1 - context_switches / 2)
+    )
+    return score, proximity, fragments, context_switches
+
+def find_candidate_slots(scheduling_strategy, current_time, duration, deadline, gaps, k=5):
+    """Return the k best-scoring slots from the free gaps, best first.
+    
+    Each gap that fits the task offers up to three candidates: its start, its
+    end, and the point closest to the strategy's target time. All of them are
+    scored in one pass over the gap list.
+    """
+    target_time = strategy_target(scheduling_strategy, current_time, duration, deadline)
+    span = deadline - current_time
+    
+    candidates = []
+    for gap_start, gap_end in gaps:
+        # Never offer a slot that has already started
+        gap_start = max(gap_start, current_time)
+        latest_start = gap_end - duration
+        if latest_start < gap_start:
             continue
         
-        # Check if search_time falls on a weekend
-        if search_time.weekday() >= 5:  # Weekend
-            days_to_subtract = 1 if search_time.weekday() == 6 else 2  # Move to previous Friday
-            search_time = search_time - timedelta(days=days_to_subtract)
-            search_time = search_time.replace(
-                hour=working_end_hour - 1, 
-                minute=0, 
-                second=0, 
-                microsecond=0
+        for start in {gap_start, latest_start, min(max(target_time, gap_start), latest_start)}:
+            score, proximity, fragments, context_switches = score_slot(
+                start, duration, gap_start, gap_end, target_time, span
             )
-            continue
-        
-        # Potential end time
-        potential_end_time = search_time + duration
-        
-        # Check if this slot conflicts with any busy period
-        conflict = False
-        for busy_start, busy_end in busy_periods:
-            # Check for overlap
-            if search_time < busy_end and potential_end_time > busy_start:
-                conflict = True
-                # Move search_time before the start of this busy period
-                search_time = busy_start - duration
-                break
-        
-        # If no conflict, we found an available slot
-        if not conflict:
-            return search_time
-        
-        # Move back by 30 minutes if there was a conflict
-        if conflict:
-            continue
-        else:
-            search_time = search_time - timedelta(minutes=30)
+            candidates.append({
+                'start': start,
+                'end': start + duration,
+                'score': round(score, 4),
+                'proximity': round(proximity, 4),
+                'fragments': fragments,
+                'context_switches': context_switches,
+            })
     
-    # If we couldn't find a slot, fall back to earliest slot method
-    return find_earliest_slot(current_time, duration, deadline, busy_periods, working_start_hour, working_end_hour)
+    return heapq.nlargest(k, candidates, key=lambda slot: (slot['score'], -slot['start'].timestamp()))
 
+def suggest_slots(user, duration_minutes, deadline, priority, k=5, exclude_task=None):
+    """Return (strategy, the k best candidate slots) for a task, avoiding the user's tasks and calendar."""
+    current_time = timezone.now()
+    duration = timedelta(minutes=duration_minutes)
+    
+    busy_periods = get_user_busy_periods(user, current_time, deadline, exclude_task)
+    gaps = free_gaps(BusyIndex(busy_periods), current_time, deadline, WORKING_START_HOUR, WORKING_END_HOUR)
+    scheduling_strategy = get_scheduling_strategy(priority, current_time, deadline)
+    return scheduling_strategy, find_candidate_slots(scheduling_strategy, current_time, duration, deadline, gaps, k)
 
-def schedule_task(user, duration_minutes, deadline, priority):
-    """Schedule a task based on availability and priority."""
+
+def schedule_task(user, duration_minutes, deadline, priority, exclude_task=None):
+    """Schedule a task based on availability and priority.
+    
+    Busy time comes from the user's other scheduled tasks and, when it can be
+    read, the local calendar mirror. Pass exclude_task when rescheduling.
+    """
+    busy_periods = get_user_busy_periods(user, timezone.now(), deadline, exclude_task)
+    
+    # Find available slot
+    return find_available_slot(
+        None,
+        duration_minutes, 
+        deadline, 
+        priority,
+        busy_periods=busy_periods
+    )
+
+def schedule_user_tasks(user):
+    """Re-plan every incomplete task for a user in one deadline-ordered pass.
+    
+    Busy time is fetched once, tasks are placed earliest-deadline-first
+    (higher priority first on ties), and each placement is added to the busy
+    index so later tasks never overlap it. Returns the tasks that moved.
+    """
+    current_time = timezone.now()
+    tasks = list(Task.objects.filter(
+        user=user,
+        completed=False,
+        deadline__gt=current_time
+    ).order_by('deadline', 'priority', 'created_at'))
+    
+    if not tasks:
+        return []
+    
+    # Read busy time once for the whole planning window, leaving out the
+    # events that belong to the tasks being re-planned
+    own_event_ids = [task.google_event_id for task in tasks if task.google_event_id]
+    busy_periods = []
     try:
-        service = get_calendar_service(user)
-        
-        # Fetch existing events
-        existing_events = get_calendar_events(
-            service, 
-            time_min=timezone.now(),
-            time_max=deadline
-        )
-        
-        # Find available slot
-        scheduled_time = find_available_slot(
-            service, 
-            duration_minutes, 
-            deadline, 
-            priority,
-            existing_events
+        busy_periods = get_mirrored_busy_periods(
+            user,
+            time_min=current_time,
+            time_max=tasks[-1].deadline,
+            exclude_event_ids=own_event_ids
         )
+    except CALENDAR_ERRORS:
+        # No Google account connected; plan against the tasks alone
+        pass
+    
+    busy = BusyIndex(busy_periods)
+    
+    changed = []
+    for task in tasks:
+        duration = timedelta(minutes=task.duration)
+        gaps = free_gaps(busy, current_time, task.deadline, WORKING_START_HOUR, WORKING_END_HOUR)
+        scheduling_strategy = get_scheduling_strategy(task.priority, current_time, task.deadline)
+        scheduled_time = select_slot(scheduling_strategy, current_time, duration, task.deadline, gaps)
+        busy.add(scheduled_time, scheduled_time + duration)
         
-        return scheduled_time
-    except Exception as e:
-        # If there's an error (e.g., no Google account connected), 
-        # just return a default time (deadline minus duration)
-        return deadline - timedelta(minutes=duration_minutes)
+        if task.scheduled_time != scheduled_time:
+            task.scheduled_time = scheduled_time
+            task.updated_at = current_time
+            changed.append(task)
+    
+    Task.objects.bulk_update(changed, ['scheduled_time', 'updated_at'])
+    if changed:
+        # bulk_update() skips the post_save signal
+        from .signals import bump_schedule_version
+        bump_schedule_version(user.id)
+    
+    # Queue moves of the matching Google Calendar events
+    from .outbox import enqueue_calendar_writes
+    enqueue_calendar_writes([task for task in changed if task.google_event_id], 'upsert')
+    
+    return changed
 
-def schedule_task_in_calendar(service, task, update=False):
-    """Schedule a task in Google Calendar."""
-    event = {
+def task_event_colour(task):
+    """Return the Google Calendar colour id for a task."""
+    if task.completed:
+        return '9'  # Green color for completed tasks
+    return '4'  # Red color for tasks
+
+def task_event_body(task):
+    """Build the Google Calendar event body for a task."""
+    return {
         'summary': task.title,
         'description': task.description,
         'start': {
@@ -368,11 +546,12 @@ def schedule_task_in_calendar(service, task, update=False):
             'dateTime': (task.scheduled_time + timedelta(minutes=task.duration)).isoformat(),
             'timeZone': 'UTC',
         },
-        'colorId': '4',  # Red color for tasks
+        'colorId': task_event_colour(task),
     }
-    
-    if task.completed:
-        event['colorId'] = '9'  # Green color for completed tasks
+
+def schedule_task_in_calendar(service, task, update=False):
+    """Schedule a task in Google Calendar."""
+    event = task_event_body(task)
     
     if update and task.google_event_id:
         # Update existing event
@@ -381,6 +560,7 @@ def schedule_task_in_calendar(service, task, update=False):
             eventId=task.google_event_id,
             body=event
         ).execute()
+        mirror_calendar_event(task.user_id, event)
         return task.google_event_id
     else:
         # Create new event
@@ -388,10 +568,11 @@ def schedule_task_in_calendar(service, task, update=False):
             calendarId='primary',
             body=event
         ).execute()
+        mirror_calendar_event(task.user_id, event)
         return event['id']
 
-def schedule_habit_in_calendar(service, habit, update=False):
-    """Add or update a recurring habit in Google Calendar."""
+def habit_event_body(habit):
+    """Build the recurring Google Calendar event body for a habit."""
     # Set recurrence rule based on frequency
     if habit.frequency == 'daily':
         recurrence = ['RRULE:FREQ=DAILY']
@@ -412,7 +593,7 @@ def schedule_habit_in_calendar(service, habit, update=False):
     )
     end_datetime = start_datetime + timedelta(minutes=habit.duration)
     
-    event = {
+    return {
         'summary': f"[Habit] {habit.title}",
         'description': habit.description,
         'start': {
@@ -433,6 +614,10 @@ def schedule_habit_in_calendar(service, habit, update=False):
         },
         'colorId': '2',  # Green color for habits
     }
+
+def schedule_habit_in_calendar(service, habit, update=False):
+    """Add or update a recurring habit in Google Calendar."""
+    event = habit_event_body(habit)
     
     if update and habit.google_event_id:
         # Update existing event
@@ -441,6 +626,7 @@ def schedule_habit_in_calendar(service, habit, update=False):
             eventId=habit.google_event_id,
             body=event
         ).execute()
+        mark_calendar_stale(habit.user_id)
         return habit.google_event_id
     else:
         # Create new event
@@ -448,4 +634,18 @@ def schedule_habit_in_calendar(service, habit, update=False):
             calendarId='primary',
             body=event
         ).execute()
-        return event['id']
\ No newline at end of file
+        mark_calendar_stale(habit.user_id)
+        return event['id']
+
+def forget_calendar_event(user_id, event_id):
+    """Remove a deleted event from the local calendar mirror."""
+    # Recurring habit events are mirrored as one row per instance
+    CalendarEvent.objects.filter(user_id=user_id).filter(
+        Q(google_event_id=event_id) |
+        Q(google_event_id__startswith=f"{event_id}_")
+    ).delete()
+
+def delete_calendar_event(service, obj):
+    """Delete the Google Calendar event of a task, habit or outbox entry."""
+    service.events().delete(calendarId='primary', eventId=obj.google_event_id).execute()
+    forget_calendar_event(obj.user_id, obj.google_event_id)
@@ -1,11 +1,22 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
 from django.utils import timezone
+from django.utils.http import http_date
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from datetime import datetime, timedelta
-from .models import Task, Habit, HabitCompletion
-from .forms import TaskForm, HabitForm
+from .models import Task, Habit, HabitCompletion, ScheduleVersion
+from .forms import TaskForm, HabitForm, TaskFilterForm
+from .feed import (
+    MAX_RANGE_DAYS, STREAM_RANGE_DAYS, calendar_rows, iter_calendar_rows, month_rows,
+    feed_payload, json_response, streaming_json_response,
+)
+from .outbox import enqueue_calendar_write
+from .pagination import keyset_page
+from .recurrence import expand_habits
 import json
 import openai
 from django.conf import settings
@@ -24,9 +35,9 @@ def chatbot_view(request):
             if not user_message:
                 return JsonResponse({'error': 'Message cannot be empty'}, status=400)
             
-            # Use the ChatbotHandler from chatbot.py
-            from .chatbot import ChatbotHandler
-            handler = ChatbotHandler()
+            # Use the shared ChatbotHandler from chatbot.py
+            from .chatbot import get_chatbot_handler
+            handler = get_chatbot_handler()
             response = handler.process_message(user_message, request.user)
             return JsonResponse(response)
             
@@ -35,6 +46,78 @@ def chatbot_view(request):
     
     return render(request, 'tasks/chatbot.html')
 
+def _sse_event(data, event=None):
+    """Format one server-sent event."""
+    frame = f"event: {event}\n" if event else ""
+    return f"{frame}data: {json.dumps(data)}\n\n"
+
+def _chat_events(handler, user_message, user):
+    """Yield the chat reply as server-sent events, ending with a 'done' event."""
+    try:
+        for response in handler.stream_message(user_message, user):
+            yield _sse_event(response, 'error' if 'error' in response else None)
+    except Exception as e:
+        yield _sse_event({'error': str(e)}, 'error')
+    yield _sse_event({}, 'done')
+
+async def _iterate_in_thread(iterator):
+    """Drive a blocking iterator from async code one item at a time, so ASGI servers flush each item."""
+    from asgiref.sync import sync_to_async
+    
+    iterator = iter(iterator)
+    sentinel = object()
+    while True:
+        item = await sync_to_async(next)(iterator, sentinel)
+        if item is sentinel:
+            break
+        yield item
+
+@login_required
+def chatbot_stream(request):
+    """Stream the chatbot's reply as server-sent events while the model generates it."""
+    from django.core.handlers.asgi import ASGIRequest
+    from django.http import StreamingHttpResponse
+    
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Only POST requests are supported'}, status=405)
+    
+    if request.content_type == 'application/json':
+        try:
+            user_message = json.loads(request.body).get('message', '').strip()
+        except (AttributeError, ValueError):
+            return JsonResponse({'error': 'Expected a JSON object with a message'}, status=400)
+    else:
+        user_message = request.POST.get('message', '').strip()
+    
+    if not user_message:
+        return JsonResponse({'error': 'Message cannot be empty'}, status=400)
+    
+    from .chatbot import get_chatbot_handler
+    try:
+        handler = get_chatbot_handler()
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+    
+    events = _chat_events(handler, user_message, request.user)
+    
+    # Under ASGI a plain iterator would be buffered to the end, so hand over an async one
+    if isinstance(request, ASGIRequest):
+        events = _iterate_in_thread(events)
+    
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@staff_member_required
+def chatbot_stats(request):
+    """API endpoint reporting how many chatbot messages were answered without the model.
+    
+    The counts live in the default cache, so they cover one process unless the cache is shared.
+    """
+    from .intents import intent_stats
+    return JsonResponse(intent_stats())
+
 @login_required
 def home(request):
     # Get upcoming tasks (next 7 days)
@@ -50,25 +133,18 @@ def home(request):
     # Get today's habits
     today_date = timezone.now().date()
     habits = Habit.objects.filter(user=request.user)
-    today_habits = []
-    
-    for habit in habits:
-        # Check if habit is scheduled for today based on frequency
-        if habit.frequency == 'daily':
-            today_habits.append(habit)
-        elif habit.frequency == 'weekly' and habit.start_date.weekday() == today_date.weekday():
-            today_habits.append(habit)
-        elif habit.frequency == 'monthly' and habit.start_date.day == today_date.day:
-            today_habits.append(habit)
-    
-    # Check which habits are completed today
+    today_habits = [
+        habit for habit, day in expand_habits(habits, today_date, today_date + timedelta(days=1))
+    ]
+    
+    # Check which habits are completed today; a missing row means not completed
+    completed_today = set(HabitCompletion.objects.filter(
+        habit__user=request.user,
+        completed_date=today_date,
+        completed=True
+    ).values_list('habit_id', flat=True))
     for habit in today_habits:
-        completion, created = HabitCompletion.objects.get_or_create(
-            habit=habit,
-            completed_date=today_date,
-            defaults={'completed': False}
-        )
-        habit.is_completed_today = completion.completed
+        habit.is_completed_today = habit.id in completed_today
     
     context = {
         'upcoming_tasks': upcoming_tasks,
@@ -77,37 +153,88 @@ def home(request):
     }
     return render(request, 'tasks/home.html', context)
 
+def _page_queries(request, next_cursor):
+    """Build the query strings for the first and next pages, keeping the current filters.
+    
+    Either is None when there is no such page to link to.
+    """
+    query = request.GET.copy()
+    cursor = query.pop('cursor', None)
+    first_page_query = query.urlencode() if cursor else None
+    
+    next_page_query = None
+    if next_cursor:
+        query['cursor'] = next_cursor
+        next_page_query = query.urlencode()
+    return first_page_query, next_page_query
+
 @login_required
 def task_list(request):
-    tasks = Task.objects.filter(user=request.user).order_by('-created_at')
-    return render(request, 'tasks/task_list.html', {'tasks': tasks})
+    filter_form = TaskFilterForm(request.GET)
+    tasks = filter_form.filter(Task.objects.filter(user=request.user))
+    
+    try:
+        tasks, next_cursor = keyset_page(tasks, request.GET.get('cursor'))
+    except ValueError:
+        messages.error(request, 'That page link is no longer valid.')
+        return redirect('tasks:task_list')
+    
+    first_page_query, next_page_query = _page_queries(request, next_cursor)
+    context = {
+        'tasks': tasks,
+        'filter_form': filter_form,
+        'first_page_query': first_page_query,
+        'next_page_query': next_page_query,
+    }
+    return render(request, 'tasks/task_list.html', context)
+
+@login_required
+def task_list_data(request):
+    """API endpoint returning one page of the task list for infinite scroll."""
+    filter_form = TaskFilterForm(request.GET)
+    if not filter_form.is_valid():
+        return JsonResponse({'error': filter_form.errors}, status=400)
+    tasks = filter_form.filter(Task.objects.filter(user=request.user))
+    
+    try:
+        tasks, next_cursor = keyset_page(tasks, request.GET.get('cursor'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    results = [{
+        'id': task.id,
+        'title': task.title,
+        'description': task.description,
+        'duration': task.duration,
+        'deadline': task.deadline.isoformat(),
+        'priority': task.priority,
+        'scheduled_time': task.scheduled_time.isoformat() if task.scheduled_time else None,
+        'completed': task.completed,
+        'created_at': task.created_at.isoformat(),
+    } for task in tasks]
+    
+    return JsonResponse({'results': results, 'next_cursor': next_cursor})
 
 
 
 @login_required
 def task_create(request):
     if request.method == 'POST':
-        form = TaskForm(request.POST)
+        form = TaskForm(request.POST, user=request.user)
         if form.is_valid():
             task = form.save(commit=False)
             task.user = request.user
             
-            # Schedule the task based on availability
-            from .utils import schedule_task
-            scheduled_time = schedule_task(request.user, task.duration, task.deadline, task.priority)
+            # Use the slot picked from the suggestions, or schedule based on availability
+            scheduled_time = form.cleaned_data.get('scheduled_slot')
+            if scheduled_time is None:
+                from .utils import schedule_task
+                scheduled_time = schedule_task(request.user, task.duration, task.deadline, task.priority)
             task.scheduled_time = scheduled_time
             task.save()
             
-            # Add to Google Calendar if user has connected their account
-            if hasattr(request.user, 'socialaccount_set') and request.user.socialaccount_set.filter(provider='google').exists():
-                try:
-                    from .utils import get_calendar_service, schedule_task_in_calendar
-                    service = get_calendar_service(request.user)
-                    event_id = schedule_task_in_calendar(service, task)
-                    task.google_event_id = event_id
-                    task.save()
-                except Exception as e:
-                    messages.warning(request, f"Could not add task to Google Calendar: {str(e)}")
+            # Queue adding it to Google Calendar if user has connected their account
+            enqueue_calendar_write(task, 'upsert')
             
             messages.success(request, 'Task created successfully!')
             return redirect('tasks:task_list')
@@ -116,6 +243,32 @@ def task_create(request):
     
     return render(request, 'tasks/task_form.html', {'form': form, 'title': 'Create Task'})
 
+@login_required
+def suggest_task_slots(request):
+    """API endpoint returning the best candidate slots for a task being created or edited."""
+    from django.utils.dateparse import parse_datetime
+    from .utils import suggest_slots
+    
+    try:
+        duration = int(request.GET['duration'])
+        deadline = parse_datetime(request.GET['deadline'])
+        priority = int(request.GET.get('priority', 2))
+        k = min(int(request.GET.get('k', 5)), 10)
+        task_id = int(request.GET.get('task') or 0)
+        if deadline is None or duration <= 0 or k <= 0:
+            raise ValueError
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'duration (minutes) and deadline (YYYY-MM-DDTHH:MM) are required'}, status=400)
+    
+    if timezone.is_naive(deadline):
+        deadline = timezone.make_aware(deadline)
+    
+    # When editing, the task's own current slot doesn't count as busy
+    exclude_task = Task.objects.filter(pk=task_id, user=request.user).first() if task_id else None
+    
+    strategy, slots = suggest_slots(request.user, duration, deadline, priority, k, exclude_task)
+    return JsonResponse({'strategy': strategy, 'slots': slots})
+
 @login_required
 def task_detail(request, pk):
     task = get_object_or_404(Task, pk=pk, user=request.user)
@@ -126,26 +279,22 @@ def task_edit(request, pk):
     task = get_object_or_404(Task, pk=pk, user=request.user)
     
     if request.method == 'POST':
-        form = TaskForm(request.POST, instance=task)
+        form = TaskForm(request.POST, instance=task, user=request.user)
         if form.is_valid():
             task = form.save(commit=False)
             
-            # Reschedule the task if needed
-            if form.has_changed() and any(field in form.changed_data for field in ['duration', 'deadline', 'priority']):
+            # Use the slot picked from the suggestions, or reschedule the task if needed
+            if form.cleaned_data.get('scheduled_slot'):
+                task.scheduled_time = form.cleaned_data['scheduled_slot']
+            elif form.has_changed() and any(field in form.changed_data for field in ['duration', 'deadline', 'priority']):
                 from .utils import schedule_task
-                scheduled_time = schedule_task(request.user, task.duration, task.deadline, task.priority)
+                scheduled_time = schedule_task(request.user, task.duration, task.deadline, task.priority, exclude_task=task)
                 task.scheduled_time = scheduled_time
             
             task.save()
             
-            # Update Google Calendar event if it exists
-            if task.google_event_id and hasattr(request.user, 'socialaccount_set') and request.user.socialaccount_set.filter(provider='google').exists():
-                try:
-                    from .utils import get_calendar_service, schedule_task_in_calendar
-                    service = get_calendar_service(request.user)
-                    schedule_task_in_calendar(service, task, update=True)
-                except Exception as e:
-                    messages.warning(request, f"Could not update Google Calendar: {str(e)}")
+            # Queue updating the Google Calendar event
+            enqueue_calendar_write(task, 'upsert')
             
             messages.success(request, 'Task updated successfully!')
             return redirect('tasks:task_detail', pk=task.pk)
@@ -159,14 +308,8 @@ def task_delete(request, pk):
     task = get_object_or_404(Task, pk=pk, user=request.user)
     
     if request.method == 'POST':
-        # Delete from Google Calendar if it exists
-        if task.google_event_id and hasattr(request.user, 'socialaccount_set') and request.user.socialaccount_set.filter(provider='google').exists():
-            try:
-                from .utils import get_calendar_service
-                service = get_calendar_service(request.user)
-                service.events().delete(calendarId='primary', eventId=task.google_event_id).execute()
-            except Exception as e:
-                messages.warning(request, f"Could not delete from Google Calendar: {str(e)}")
+        # Queue deleting it from Google Calendar
+        enqueue_calendar_write(task, 'delete')
         
         task.delete()
         messages.success(request, 'Task deleted successfully!')
@@ -182,21 +325,8 @@ def task_complete(request, pk):
         task.completed = not task.completed  # Toggle completion status
         task.save()
         
-        # Update Google Calendar event if it exists
-        if task.google_event_id and hasattr(request.user, 'socialaccount_set') and request.user.socialaccount_set.filter(provider='google').exists():
-            try:
-                from .utils import get_calendar_service
-                service = get_calendar_service(request.user)
-                event = service.events().get(calendarId='primary', eventId=task.google_event_id).execute()
-                
-                if task.completed:
-                    event['colorId'] = '9'  # Green color for completed tasks
-                else:
-                    event['colorId'] = '4'  # Red color for incomplete tasks
-                
-                service.events().update(calendarId='primary', eventId=task.google_event_id, body=event).execute()
-            except Exception as e:
-                messages.warning(request, f"Could not update Google Calendar: {str(e)}")
+        # Queue recolouring the Google Calendar event
+        enqueue_calendar_write(task, 'complete')
         
         status = 'completed' if task.completed else 'marked as incomplete'
         messages.success(request, f'Task {status} successfully!')
@@ -208,8 +338,40 @@ def task_complete(request, pk):
 
 @login_required
 def habit_list(request):
-    habits = Habit.objects.filter(user=request.user).order_by('-created_at')
-    return render(request, 'tasks/habit_list.html', {'habits': habits})
+    try:
+        habits, next_cursor = keyset_page(Habit.objects.filter(user=request.user), request.GET.get('cursor'))
+    except ValueError:
+        messages.error(request, 'That page link is no longer valid.')
+        return redirect('tasks:habit_list')
+    
+    first_page_query, next_page_query = _page_queries(request, next_cursor)
+    context = {
+        'habits': habits,
+        'first_page_query': first_page_query,
+        'next_page_query': next_page_query,
+    }
+    return render(request, 'tasks/habit_list.html', context)
+
+@login_required
+def habit_list_data(request):
+    """API endpoint returning one page of the habit list for infinite scroll."""
+    try:
+        habits, next_cursor = keyset_page(Habit.objects.filter(user=request.user), request.GET.get('cursor'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    results = [{
+        'id': habit.id,
+        'title': habit.title,
+        'description': habit.description,
+        'frequency': habit.frequency,
+        'duration': habit.duration,
+        'start_date': habit.start_date.isoformat(),
+        'preferred_time': habit.preferred_time.strftime('%H:%M'),
+        'created_at': habit.created_at.isoformat(),
+    } for habit in habits]
+    
+    return JsonResponse({'results': results, 'next_cursor': next_cursor})
 
 @login_required
 def habit_create(request):
@@ -220,16 +382,8 @@ def habit_create(request):
             habit.user = request.user
             habit.save()
             
-            # Add to Google Calendar if user has connected their account
-            if hasattr(request.user, 'socialaccount_set') and request.user.socialaccount_set.filter(provider='google').exists():
-                try:
-                    from .utils import get_calendar_service, schedule_habit_in_calendar
-                    service = get_calendar_service(request.user)
-                    event_id = schedule_habit_in_calendar(service, habit)
-                    habit.google_event_id = event_id
-                    habit.save()
-                except Exception as e:
-                    messages.warning(request, f"Could not add habit to Google Calendar: {str(e)}")
+            # Queue adding it to Google Calendar if user has connected their account
+            enqueue_calendar_write(habit, 'upsert')
             
             messages.success(request, 'Habit created successfully!')
             return redirect('tasks:habit_list')
@@ -279,14 +433,8 @@ def habit_edit(request, pk):
         if form.is_valid():
             habit = form.save()
             
-            # Update Google Calendar event if it exists
-            if habit.google_event_id and hasattr(request.user, 'socialaccount_set') and request.user.socialaccount_set.filter(provider='google').exists():
-                try:
-                    from .utils import get_calendar_service, schedule_habit_in_calendar
-                    service = get_calendar_service(request.user)
-                    schedule_habit_in_calendar(service, habit, update=True)
-                except Exception as e:
-                    messages.warning(request, f"Could not update Google Calendar: {str(e)}")
+            # Queue updating the Google Calendar event
+            enqueue_calendar_write(habit, 'upsert')
             
             messages.success(request, 'Habit updated successfully!')
             return redirect('tasks:habit_detail', pk=habit.pk)
@@ -300,14 +448,8 @@ def habit_delete(request, pk):
     habit = get_object_or_404(Habit, pk=pk, user=request.user)
     
     if request.method == 'POST':
-        # Delete from Google Calendar if it exists
-        if habit.google_event_id and hasattr(request.user, 'socialaccount_set') and request.user.socialaccount_set.filter(provider='google').exists():
-            try:
-                from .utils import get_calendar_service
-                service = get_calendar_service(request.user)
-                service.events().delete(calendarId='primary', eventId=habit.google_event_id).execute()
-            except Exception as e:
-                messages.warning(request, f"Could not delete from Google Calendar: {str(e)}")
+        # Queue deleting it from Google Calendar
+        enqueue_calendar_write(habit, 'delete')
         
         habit.delete()
         messages.success(request, 'Habit deleted successfully!')
@@ -348,98 +490,91 @@ def habit_complete(request, pk, date):
 def calendar_view(request):
     return render(request, 'tasks/calendar.html')
 
+def _calendar_month(request):
+    """Return the (year, month) requested, defaulting to the current month."""
+    year = int(request.GET.get('year', timezone.now().year))
+    month = int(request.GET.get('month', timezone.now().month))
+    return year, month
+
+
+def _schedule_version(request):
+    """Return the user's (version, updated_at), read once per request."""
+    if not hasattr(request, '_schedule_version'):
+        request._schedule_version = ScheduleVersion.objects.filter(
+            user=request.user
+        ).values_list('version', 'updated_at').first() or (0, None)
+    return request._schedule_version
+
+
+def _calendar_data_etag(request):
+    version, updated_at = _schedule_version(request)
+    year, month = _calendar_month(request)
+    # The version counts per user, so the user is part of the tag
+    return f"{request.user.pk}-{version}-{year}-{month}-{request.GET.get('format', '')}"
+
+
+def _with_last_modified(request, response):
+    """Add the Last-Modified header to a calendar response.
+    
+    It is not passed to @condition: updated_at is not unique per user, so an
+    If-Modified-Since alone must never produce a 304. Only the ETag does.
+    """
+    version, updated_at = _schedule_version(request)
+    if updated_at is not None:
+        response['Last-Modified'] = http_date(updated_at.timestamp())
+    return response
+
+
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_calendar_data_etag)
 def calendar_data(request):
     """API endpoint to get calendar data for a specific month."""
-    from django.http import JsonResponse
-    
     # Get year and month from request parameters
-    year = int(request.GET.get('year', timezone.now().year))
-    month = int(request.GET.get('month', timezone.now().month))
+    year, month = _calendar_month(request)
     
-    # Create date range for the month
-    start_date = timezone.datetime(year, month, 1, tzinfo=timezone.get_current_timezone())
-    if month == 12:
-        end_date = timezone.datetime(year + 1, 1, 1, tzinfo=timezone.get_current_timezone())
+    # Project only the columns the calendar shows; ?format=compact sends arrays with a field header
+    version, updated_at = _schedule_version(request)
+    rows = month_rows(request.user, year, month, version)
+    return _with_last_modified(request, json_response(feed_payload(rows, compact=request.GET.get('format') == 'compact')))
+
+
+def _calendar_range(request):
+    """Return the aware [start, end) datetimes for the start and end dates requested."""
+    start = datetime.strptime(request.GET['start'], '%Y-%m-%d')
+    end = datetime.strptime(request.GET['end'], '%Y-%m-%d')
+    return timezone.make_aware(start), timezone.make_aware(end)
+
+
+def _calendar_range_etag(request):
+    version, updated_at = _schedule_version(request)
+    return f"{request.user.pk}-{version}-{request.GET.get('start')}-{request.GET.get('end')}-{request.GET.get('format', '')}"
+
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_calendar_range_etag)
+def calendar_range_data(request):
+    """API endpoint to get calendar data between a start date and an end date (exclusive)."""
+    try:
+        start, end = _calendar_range(request)
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'start and end must be dates in YYYY-MM-DD format'}, status=400)
+    
+    span = (end - start).days
+    if span <= 0:
+        return JsonResponse({'error': 'end must be after start'}, status=400)
+    if span > MAX_RANGE_DAYS:
+        return JsonResponse({'error': f'Ranges are limited to {MAX_RANGE_DAYS} days'}, status=400)
+    
+    compact = request.GET.get('format') == 'compact'
+    
+    # Long ranges are encoded chunk by chunk as the rows are read
+    if span > STREAM_RANGE_DAYS:
+        response = streaming_json_response(iter_calendar_rows(request.user, start, end), compact=compact)
     else:
-        end_date = timezone.datetime(year, month + 1, 1, tzinfo=timezone.get_current_timezone())
-    
-    # Get tasks for the month
-    tasks = Task.objects.filter(
-        user=request.user,
-        scheduled_time__gte=start_date,
-        scheduled_time__lt=end_date
-    )
-    
-    # Get habits for the month
-    habits = Habit.objects.filter(user=request.user)
-    
-    # Prepare events data
-    events = []
-    
-    # Add tasks to events
-    for task in tasks:
-        # Format the date in YYYY-MM-DD format for consistency
-        task_date = task.scheduled_time.date().isoformat()
-        events.append({
-            'id': task.id,
-            'title': task.title,
-            'date': task.scheduled_time.isoformat(),
-            'date_ymd': task_date,  # Add a consistent YYYY-MM-DD format date
-            'time': task.scheduled_time.strftime('%H:%M'),
-            'type': 'task',
-            'priority': task.priority,
-            'completed': task.completed,
-            'description': task.description,
-            'duration': task.duration,
-            'deadline': task.deadline.isoformat() if task.deadline else None
-        })
-    
-    # Add habits to events
-    for habit in habits:
-        # Generate habit occurrences based on frequency
-        current_date = start_date.date()
-        end_date_day = end_date.date()
-        
-        while current_date < end_date_day:
-            add_habit = False
-            
-            if habit.frequency == 'daily':
-                add_habit = True
-            elif habit.frequency == 'weekly' and habit.start_date.weekday() == current_date.weekday():
-                add_habit = True
-            elif habit.frequency == 'monthly' and habit.start_date.day == current_date.day:
-                add_habit = True
-            
-            if add_habit:
-                # Check if habit is completed for this date
-                completion = HabitCompletion.objects.filter(
-                    habit=habit,
-                    completed_date=current_date
-                ).first()
-                
-                # Create datetime combining current date with preferred time
-                habit_datetime = timezone.datetime.combine(
-                    current_date,
-                    habit.preferred_time,
-                    tzinfo=timezone.get_current_timezone()
-                )
-                
-                events.append({
-                    'id': habit.id,
-                    'title': habit.title,
-                    'date': habit_datetime.isoformat(),
-                    'time': habit.preferred_time.strftime('%H:%M'),
-                    'type': 'habit',
-                    'completed': completion.completed if completion else False,
-                    'description': habit.description,
-                    'duration': habit.duration,
-                    'frequency': habit.get_frequency_display()
-                })
-            
-            current_date += timedelta(days=1)
-    
-    return JsonResponse({'events': events})
+        response = json_response(feed_payload(calendar_rows(request.user, start, end), compact=compact))
+    return _with_last_modified(request, response)
 
 
 @login_required
@@ -483,15 +618,8 @@ def update_task_schedule(request):
                 
                 task.save()
                 
-                # Update Google Calendar if connected
-                if task.google_event_id and hasattr(request.user, 'socialaccount_set') and request.user.socialaccount_set.filter(provider='google').exists():
-                    try:
-                        from .utils import get_calendar_service, schedule_task_in_calendar
-                        service = get_calendar_service(request.user)
-                        schedule_task_in_calendar(service, task, update=True)
-                    except Exception as e:
-                        # Log the error but don't fail the request
-                        print(f"Could not update Google Calendar: {str(e)}")
+                # Queue updating Google Calendar if connected
+                enqueue_calendar_write(task, 'upsert')
                 
                 return JsonResponse({'status': 'success'})
             except ValueError as e:
@@ -503,3 +631,73 @@ def update_task_schedule(request):
             return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
     
     return JsonResponse({'status': 'error', 'message': 'Only POST requests are allowed'}, status=405)
+
+
+# Most task moves accepted in one bulk request
+MAX_BULK_MOVES = 500
+
+
+@login_required
+def bulk_update_task_schedule(request):
+    """API endpoint to move many tasks at once, e.g. a multi-select drag or shifting a day."""
+    from django.db import transaction
+    from .outbox import enqueue_calendar_writes
+    from .signals import bump_schedule_version
+    
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Only POST requests are allowed'}, status=405)
+    
+    try:
+        moves = json.loads(request.body).get('moves')
+        if not isinstance(moves, list) or not moves:
+            raise ValueError("Expected a non-empty list of moves")
+        if len(moves) > MAX_BULK_MOVES:
+            raise ValueError(f"At most {MAX_BULK_MOVES} moves can be sent at once")
+        
+        # Parse every move before touching the database
+        new_times = {}
+        for move in moves:
+            date_obj = datetime.strptime(move['new_date'], '%Y-%m-%d').date()
+            time_obj = datetime.strptime(move.get('new_time', '00:00'), '%H:%M').time()
+            new_times[int(move['task_id'])] = timezone.make_aware(datetime.combine(date_obj, time_obj))
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        return JsonResponse({'status': 'error', 'message': f"Invalid moves: {str(e)}"}, status=400)
+    
+    now = timezone.now()
+    with transaction.atomic():
+        tasks = Task.objects.select_for_update().filter(user=request.user, id__in=new_times)
+        tasks = list(tasks)
+        
+        missing = set(new_times) - {task.id for task in tasks}
+        if missing:
+            return JsonResponse({
+                'status': 'error',
+                'message': f"Tasks not found: {', '.join(str(task_id) for task_id in sorted(missing))}"
+            }, status=404)
+        
+        # Like a single move, a task without a scheduled time can't be dragged
+        unscheduled = [task.id for task in tasks if task.scheduled_time is None]
+        if unscheduled:
+            return JsonResponse({
+                'status': 'error',
+                'message': f"Tasks not scheduled yet: {', '.join(str(task_id) for task_id in sorted(unscheduled))}"
+            }, status=400)
+        
+        for task in tasks:
+            new_scheduled_time = new_times[task.id]
+            
+            # The deadline keeps its distance from the scheduled time
+            if task.deadline:
+                task.deadline = task.deadline + (new_scheduled_time - task.scheduled_time)
+            task.scheduled_time = new_scheduled_time
+            task.updated_at = now
+        
+        Task.objects.bulk_update(tasks, ['scheduled_time', 'deadline', 'updated_at'])
+        
+        # bulk_update() skips the post_save signal
+        bump_schedule_version(request.user.id)
+        
+        # Queue updating Google Calendar if connected
+        enqueue_calendar_writes(tasks, 'upsert')
+    
+    return JsonResponse({'status': 'success', 'updated': len(tasks)})